@@ -8,3 +8,8 @@ PARAGRAPH_SEPARATOR = '<p>'
 
 
 DEFAULT_WAIT_TIME = 3
+DEFAULT_CONCURRENCY = 8
+DEFAULT_PER_HOST_LIMIT = 4
+DEFAULT_EXTRACT_WORKERS = None
+WRITE_BATCH_SIZE = 100
+WRITE_FLUSH_INTERVAL = 30
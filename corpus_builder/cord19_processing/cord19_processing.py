@@ -1,15 +1,29 @@
-import json
+import hashlib
 import os
 import random
+from concurrent.futures import ProcessPoolExecutor
 from os import listdir
 from os.path import isfile, join
 from pathlib import Path
 
 import pandas as pd
-import pypandoc
 
-from config import JSON_INDENT
-from corpus_builder.utilities import replace_linebreaks
+from corpus_builder import json_codec
+from corpus_builder.docx_conversion import convert_texts_to_docx
+from corpus_builder.utilities import replace_linebreaks, JsonArrayWriter, iter_json_array
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+CORPUS_BATCH_SIZE = 1000
+PARSE_CHUNK_SIZE = 64
+MANIFEST_FILENAME = 'manifest.jsonl'
+FINGERPRINTS_FILENAME = 'fingerprints.json'
+METADATA_COLUMNS = ['sha', 'journal', 'doi', 'url', 'publish_time']
+METADATA_DTYPES = {'journal': 'category'}
+METADATA_CACHE_FORMAT = 'metadata-{SIZE}-{MTIME}.feather'
 
 
 def get_authors_and_countries(paper_json):
@@ -58,20 +72,160 @@ def process_paper(paper_json):
     return '\n'.join(all_text)
 
 
+def get_document_parse_paths(input_dir):
+    pdf_json_dir = join(input_dir, 'document_parses', 'pdf_json')
+    pmc_json_dir = join(input_dir, 'document_parses', 'pmc_json')
+
+    # Sorted so that the output order doesn't depend on the order the file system lists the files in
+    pdf_json_files = sorted(join(pdf_json_dir, f) for f in listdir(pdf_json_dir) if
+                            isfile(join(pdf_json_dir, f)))
+    pmc_json_files = sorted(join(pmc_json_dir, f) for f in listdir(pmc_json_dir) if
+                            isfile(join(pmc_json_dir, f)))
+    return pdf_json_files + pmc_json_files
+
+
+def get_file_sha1(path):
+    with open(path, 'rb') as fp:
+        return hashlib.sha1(fp.read()).hexdigest()
+
+
+def is_file_unchanged(path, fingerprint):
+    # The hash is only computed if the size matches but the mtime doesn't, e.g. after extracting a new release
+    stat = os.stat(path)
+    if stat.st_size != fingerprint['size']:
+        return False
+    return stat.st_mtime == fingerprint['mtime'] or get_file_sha1(path) == fingerprint['sha1']
+
+
+def parse_paper_file(path):
+    with open(path, 'rb') as fp:
+        content = fp.read()
+    paper_json = json_codec.loads(content)
+
+    paper_text = replace_linebreaks(process_paper(paper_json))
+    authors, countries = get_authors_and_countries(paper_json)
+    stat = os.stat(path)
+    fingerprint = {'size': stat.st_size,
+                   'mtime': stat.st_mtime,
+                   'sha1': hashlib.sha1(content).hexdigest(),
+                   'paper_id': paper_json['paper_id']}
+    return paper_json['paper_id'], paper_json['metadata']['title'], paper_text, authors, countries, fingerprint
+
+
+def parse_paper_files(paths, workers=1):
+    # Yields the parsed papers in the order of `paths`, however the work is split between the worker processes
+    if workers <= 1:
+        yield from map(parse_paper_file, paths)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(parse_paper_file, paths, chunksize=PARSE_CHUNK_SIZE)
+
+
+def build_sha_index(df_metadata):
+    # A paper with several PDFs lists all of their SHAs in one cell, separated by '; '. Every SHA is mapped
+    # to the first row it appears in.
+    df_sha = df_metadata.dropna(subset=['sha'])
+    df_sha = df_sha.assign(sha=df_sha['sha'].str.split(';')).explode('sha')
+    df_sha['sha'] = df_sha['sha'].str.strip()
+    df_sha = df_sha.drop_duplicates(subset='sha', keep='first')
+    return dict(zip(df_sha['sha'], df_sha.to_dict('records')))
+
+
+def read_cord19_metadata(input_dir):
+    # Only the columns that end up in the output are read. If pyarrow is installed, they are also cached as a Feather
+    # file next to metadata.csv, which is named after the size and mtime of metadata.csv, so that a new release
+    # doesn't use the cache of the previous one.
+    cord_metadata_path = join(input_dir, 'metadata.csv')
+    if pyarrow is None:
+        return pd.read_csv(cord_metadata_path, usecols=METADATA_COLUMNS, dtype=METADATA_DTYPES, low_memory=False)
+
+    stat = os.stat(cord_metadata_path)
+    cache_path = join(input_dir, METADATA_CACHE_FORMAT.format(SIZE=stat.st_size, MTIME=stat.st_mtime_ns))
+    if isfile(cache_path):
+        print(f'Reading cached CORD-19 metadata from {cache_path}')
+        return pd.read_feather(cache_path)
+
+    df_metadata = pd.read_csv(cord_metadata_path, usecols=METADATA_COLUMNS, dtype=METADATA_DTYPES, low_memory=False)
+    for stale_cache_path in Path(input_dir).glob(METADATA_CACHE_FORMAT.format(SIZE='*', MTIME='*')):
+        stale_cache_path.unlink()
+    try:
+        df_metadata.to_feather(f'{cache_path}.tmp')
+        os.replace(f'{cache_path}.tmp', cache_path)
+    except OSError as e:
+        print(f'Could not cache CORD-19 metadata! Exception: {e}')
+    return df_metadata
+
+
+def load_sha_index(input_dir):
+    return build_sha_index(read_cord19_metadata(input_dir))
+
+
+def get_paper_metadata(sha_index, paper_sha1, title, authors, countries):
+    paper_info = sha_index.get(paper_sha1)
+    if paper_info is not None:
+        return {'id': paper_sha1,
+                'title': title,
+                'author': authors,
+                'location': countries,
+                'journal': paper_info['journal'],
+                'doi': paper_info['doi'],
+                'url': paper_info['url'],
+                'publication_date': paper_info['publish_time']}
+    else:
+        return {'id': paper_sha1,
+                'title': title,
+                'author': authors,
+                'location': countries,
+                'journal': None,
+                'doi': None,
+                'url': None,
+                'publication_date': None}
+
+
+def get_document_parse_key(path):
+    # e.g. 'pdf_json/<sha>.json', which tells the PDF and PMC parses of the same paper apart
+    return '/'.join(Path(path).parts[-2:])
+
+
+def read_manifest(manifest_path):
+    # Returns the completed batches and the size of the manifest up to the last of them. A run that was killed
+    # while appending to the manifest leaves an incomplete last line behind, which is ignored.
+    entries = []
+    valid_size = 0
+    try:
+        with open(manifest_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entries.append(json_codec.loads(line))
+                except ValueError:
+                    break
+                valid_size += len(line)
+    except FileNotFoundError:
+        pass
+    return entries, valid_size
+
+
+def append_manifest_entry(manifest_fp, entry):
+    manifest_fp.write(json_codec.dumps(entry, indent=None) + '\n')
+    manifest_fp.flush()
+
+
+def write_fingerprints(fingerprints_path, fingerprints):
+    with open(f'{fingerprints_path}.tmp', 'w') as f:
+        json_codec.dump(fingerprints, f)
+    os.replace(f'{fingerprints_path}.tmp', fingerprints_path)
+
+
 def generate_cord19_docx_sample(input_dir, output_dir, limit=200):
     if not os.path.isabs(input_dir):
         input_dir = os.path.join(os.getcwd(), input_dir)
     if not os.path.isabs(output_dir):
         output_dir = os.path.join(os.getcwd(), output_dir)
 
-    pdf_json_dir = join(input_dir, 'document_parses', 'pdf_json')
-    pmc_json_dir = join(input_dir, 'document_parses', 'pmc_json')
-
-    pdf_json_files = [join(pdf_json_dir, f) for f in listdir(pdf_json_dir) if
-                      isfile(join(pdf_json_dir, f))]
-    pmc_json_files = [join(pmc_json_dir, f) for f in listdir(pmc_json_dir) if
-                      isfile(join(pmc_json_dir, f))]
-    all_json_paths = pdf_json_files + pmc_json_files
+    all_json_paths = get_document_parse_paths(input_dir)
 
     max_num_articles_export = min(len(all_json_paths), limit)
 
@@ -82,105 +236,202 @@ def generate_cord19_docx_sample(input_dir, output_dir, limit=200):
 
     paper_ids_and_texts = []
     for path in sampled_json_paths:
-        with open(path) as fp:
-            json_data = json.load(fp)
-            paper_id = json_data['paper_id']
-            paper_text = process_paper(json_data)
-            paper_text = replace_linebreaks(paper_text)
-            paper_ids_and_texts.append((paper_id, paper_text))
-
-    num_articles_exported = 0
-    for index, (paper_id, paper_text) in enumerate(paper_ids_and_texts):
-        print(f'Processing paper {index + 1}/{len(paper_ids_and_texts)}')
-
-        output_txt = os.path.join(docx_output_dir, f'{paper_id}.txt')
-        output_docx = os.path.join(docx_output_dir, f'{paper_id}.docx')
-        with open(output_txt, "w") as text_file:
-            text_file.write(f'{paper_text}\n')
-            num_articles_exported += 1
-        pypandoc.convert_file(output_txt, 'docx', format='markdown', outputfile=output_docx)
-        os.remove(output_txt)
+        json_data = json_codec.load_file(path)
+        paper_id = json_data['paper_id']
+        paper_text = process_paper(json_data)
+        paper_text = replace_linebreaks(paper_text)
+        paper_ids_and_texts.append((paper_id, paper_text))
+
+    texts_and_paths = [(paper_text, join(docx_output_dir, f'{paper_id}.docx'))
+                       for paper_id, paper_text in paper_ids_and_texts]
+    num_articles_exported = convert_texts_to_docx(texts_and_paths)
     print(f'Success: {num_articles_exported} .docx files have been saved to {docx_output_dir}')
 
 
-def process_cord19(input_dir, output_dir, limit=None):
+def process_cord19(input_dir, output_dir, limit=None, workers=1, resume=False):
     if not os.path.isabs(input_dir):
         input_dir = os.path.join(os.getcwd(), input_dir)
     if not os.path.isabs(output_dir):
         output_dir = os.path.join(os.getcwd(), output_dir)
 
-    pdf_json_dir = join(input_dir, 'document_parses', 'pdf_json')
-    pmc_json_dir = join(input_dir, 'document_parses', 'pmc_json')
+    all_json_paths = get_document_parse_paths(input_dir)
 
-    pdf_json_files = [join(pdf_json_dir, f) for f in listdir(pdf_json_dir) if
-                      isfile(join(pdf_json_dir, f))]
-    pmc_json_files = [join(pmc_json_dir, f) for f in listdir(pmc_json_dir) if
-                      isfile(join(pmc_json_dir, f))]
-    all_json_paths = pdf_json_files + pmc_json_files
-
-    cord_metadata_path = join(input_dir, 'metadata.csv')
-
-    df_metadata = pd.read_csv(cord_metadata_path, low_memory=False)
+    sha_index = load_sha_index(input_dir)
 
     corpus_output_dir = join(output_dir, 'cord19_processed')
     Path(corpus_output_dir).mkdir(parents=True, exist_ok=True)
     corpus_output_path = join(corpus_output_dir, 'corpus.txt')
     metadata_output_path = join(corpus_output_dir, 'metadata.json')
+    manifest_path = join(corpus_output_dir, MANIFEST_FILENAME)
 
     if limit:
         max_num_articles_export = min(len(all_json_paths), limit)
     else:
         max_num_articles_export = len(all_json_paths)
 
-    metadata_output = []
-    lines_in_batch = []
-    for index, path in enumerate(all_json_paths[:max_num_articles_export]):
-        print(f'Processing CORD-19 article {index + 1}/{max_num_articles_export}')
+    # Every completed batch appends a line to the manifest with the fingerprints of its files, its paper IDs and the
+    # sizes of corpus.txt and metadata.json after it. Resuming cuts off whatever was written after the last completed
+    # batch and only parses the files that are not in the manifest yet, appending to all three files.
+    entries, manifest_size = read_manifest(manifest_path) if resume else ([], 0)
+    if entries:
+        os.truncate(corpus_output_path, entries[-1]['corpus_offset'])
+        os.truncate(metadata_output_path, entries[-1]['metadata_offset'])
+        os.truncate(manifest_path, manifest_size)
+        done_keys = {key for entry in entries for key in entry['files']}
+        num_articles_done = entries[-1]['num_articles']
+        file_mode = 'a'
+        print(f'Resuming after {num_articles_done} CORD-19 articles ({len(entries)} batches)')
+    else:
+        done_keys = set()
+        num_articles_done = 0
+        file_mode = 'w'
 
-        with open(path) as fp:
-            paper_json = json.load(fp)
+    # A fingerprints file left by an earlier run no longer matches the output, and a new one is only written at the end
+    fingerprints_path = join(corpus_output_dir, FINGERPRINTS_FILENAME)
+    if isfile(fingerprints_path):
+        os.remove(fingerprints_path)
 
-        paper_text = process_paper(paper_json)
-        paper_sha1 = paper_json['paper_id']
+    pending_json_paths = [path for path in all_json_paths[:max_num_articles_export]
+                          if get_document_parse_key(path) not in done_keys]
+    num_articles_total = num_articles_done + len(pending_json_paths)
 
-        paper_text = replace_linebreaks(paper_text)
-        authors_and_countries = get_authors_and_countries(paper_json)
+    lines_in_batch = []
+    fingerprints_in_batch = {}
+    paper_ids_in_batch = []
+    parsed_papers = zip(pending_json_paths, parse_paper_files(pending_json_paths, workers))
+    with open(corpus_output_path, file_mode) as fh, open(metadata_output_path, file_mode) as fm, \
+            open(manifest_path, file_mode) as f_manifest:
+        metadata_writer = JsonArrayWriter(fm, num_items=num_articles_done)
+        for index, (path, (paper_sha1, title, paper_text, authors, countries, fingerprint)) in \
+                enumerate(parsed_papers, num_articles_done):
+            print(f'Processing CORD-19 article {index + 1}/{num_articles_total}')
+
+            metadata_writer.write(get_paper_metadata(sha_index, paper_sha1, title, authors, countries))
+            lines_in_batch.append(f'{paper_sha1}\t{paper_text}\n')
+            fingerprints_in_batch[get_document_parse_key(path)] = fingerprint
+            paper_ids_in_batch.append(paper_sha1)
+
+            if len(lines_in_batch) >= CORPUS_BATCH_SIZE or index == num_articles_total - 1:
+                print(f'Index {index + 1}/{num_articles_total} - writing a batch of articles')
+                fh.write(''.join(lines_in_batch))
+                fh.flush()
+                fm.flush()
+                append_manifest_entry(f_manifest, {'files': fingerprints_in_batch,
+                                                   'paper_ids': paper_ids_in_batch,
+                                                   'corpus_offset': fh.tell(),
+                                                   'metadata_offset': fm.tell(),
+                                                   'num_articles': index + 1})
+                lines_in_batch = []
+                fingerprints_in_batch = {}
+                paper_ids_in_batch = []
+
+        metadata_writer.close()
+
+    entries, _ = read_manifest(manifest_path)
+    write_fingerprints(fingerprints_path,
+                       {key: fingerprint for entry in entries for key, fingerprint in entry['files'].items()})
+
+    print(f'Success: {num_articles_total} CORD-19 articles written to {corpus_output_dir}')
+
+
+def update_cord19(input_dir, output_dir, previous_output_dir, limit=None, workers=1):
+    if not os.path.isabs(input_dir):
+        input_dir = os.path.join(os.getcwd(), input_dir)
+    if not os.path.isabs(output_dir):
+        output_dir = os.path.join(os.getcwd(), output_dir)
+    if not os.path.isabs(previous_output_dir):
+        previous_output_dir = os.path.join(os.getcwd(), previous_output_dir)
 
-        try:
-            paper_info = \
-                df_metadata.loc[df_metadata['sha'].str.contains(paper_sha1, na=False), :].to_dict('records')[0]
-            paper_metadata = {'id': paper_json['paper_id'],
-                              'title': paper_json['metadata']['title'],
-                              'author': authors_and_countries[0],
-                              'location': authors_and_countries[1],
-                              'journal': paper_info['journal'],
-                              'doi': paper_info['doi'],
-                              'url': paper_info['url'],
-                              'publication_date': paper_info['publish_time']}
-        except IndexError:
-            paper_metadata = {'id': paper_json['paper_id'],
-                              'title': paper_json['metadata']['title'],
-                              'author': authors_and_countries[0],
-                              'location': authors_and_countries[1],
-                              'journal': None,
-                              'doi': None,
-                              'url': None,
-                              'publication_date': None}
-
-        metadata_output.append(paper_metadata)
-        lines_in_batch.append(f'{paper_sha1}\t{paper_text}')
-
-        if (index % 1000 == 0 and index != 0) or index == len(all_json_paths) - 1:
-            print(f'Index {index + 1}/{len(all_json_paths)} - writing a batch of articles')
-            text_to_append = '\n'.join(lines_in_batch)
-
-            with open(corpus_output_path, 'a') as fh:
-                fh.write(text_to_append)
-
-            lines_in_batch = []
-
-    with open(metadata_output_path, 'w') as f:
-        print('Writing metadata')
-        json.dump(metadata_output, f, indent=JSON_INDENT, sort_keys=True)
-
-    print(f'Success: {max_num_articles_export} CORD-19 articles written to {corpus_output_dir}')
+    # fingerprints.json is written last, so without it there is no complete previous output to update
+    previous_corpus_dir = join(previous_output_dir, 'cord19_processed')
+    try:
+        previous_fingerprints = json_codec.load_file(join(previous_corpus_dir, FINGERPRINTS_FILENAME))
+    except FileNotFoundError:
+        print(f'No {FINGERPRINTS_FILENAME} in {previous_corpus_dir} (the previous run was interrupted or predates '
+              f'updates), processing all CORD-19 articles instead')
+        process_cord19(input_dir, output_dir, limit, workers)
+        return
+
+    # Files with the same key and contents as in the previous output are kept as they are; all others are parsed.
+    # Papers whose files were removed or re-parsed are dropped from the previous output. Changed files left out by
+    # `limit` keep their previous paper and fingerprint, so that a later update still picks them up.
+    fingerprints = {}
+    changed_json_paths = []
+    for path in get_document_parse_paths(input_dir):
+        key = get_document_parse_key(path)
+        previous_fingerprint = previous_fingerprints.get(key)
+        if previous_fingerprint is not None and is_file_unchanged(path, previous_fingerprint):
+            fingerprints[key] = dict(previous_fingerprint, mtime=os.stat(path).st_mtime)
+        else:
+            changed_json_paths.append(path)
+
+    num_unchanged = len(fingerprints)
+    deferred_json_paths = changed_json_paths[limit:] if limit is not None else []
+    for path in deferred_json_paths:
+        key = get_document_parse_key(path)
+        if key in previous_fingerprints:
+            fingerprints[key] = previous_fingerprints[key]
+
+    changed_json_paths = changed_json_paths[:limit]
+    reparsed_keys = {get_document_parse_key(path) for path in changed_json_paths}
+    stale_paper_ids = {fingerprint['paper_id'] for key, fingerprint in previous_fingerprints.items()
+                       if key not in fingerprints or key in reparsed_keys}
+    print(f'{num_unchanged} CORD-19 articles unchanged, {len(changed_json_paths)} added or changed, '
+          f'{len(stale_paper_ids)} removed or changed, {len(deferred_json_paths)} left for a later update')
+
+    sha_index = load_sha_index(input_dir)
+
+    corpus_output_dir = join(output_dir, 'cord19_processed')
+    Path(corpus_output_dir).mkdir(parents=True, exist_ok=True)
+    corpus_output_path = join(corpus_output_dir, 'corpus.txt')
+    metadata_output_path = join(corpus_output_dir, 'metadata.json')
+
+    # The merged files are written next to the outputs and only replace them once they are complete, so the
+    # previous output may also be the output directory
+    paper_ids = []
+    with open(f'{corpus_output_path}.tmp', 'w') as fh, open(f'{metadata_output_path}.tmp', 'w') as fm:
+        metadata_writer = JsonArrayWriter(fm)
+
+        with open(join(previous_corpus_dir, 'corpus.txt')) as f_previous:
+            for line in f_previous:
+                paper_sha1 = line.split('\t', 1)[0]
+                if paper_sha1 not in stale_paper_ids:
+                    fh.write(line)
+                    paper_ids.append(paper_sha1)
+
+        # Only the fields that come from the document parses are kept; the rest are looked up again, so that changes
+        # to metadata.csv in the new release are applied to the kept papers too
+        with open(join(previous_corpus_dir, 'metadata.json')) as f_previous:
+            for paper_metadata in iter_json_array(f_previous):
+                if paper_metadata['id'] not in stale_paper_ids:
+                    metadata_writer.write(get_paper_metadata(sha_index, paper_metadata['id'], paper_metadata['title'],
+                                                             paper_metadata['author'], paper_metadata['location']))
+
+        parsed_papers = zip(changed_json_paths, parse_paper_files(changed_json_paths, workers))
+        for index, (path, (paper_sha1, title, paper_text, authors, countries, fingerprint)) in \
+                enumerate(parsed_papers):
+            print(f'Processing CORD-19 article {index + 1}/{len(changed_json_paths)}')
+            metadata_writer.write(get_paper_metadata(sha_index, paper_sha1, title, authors, countries))
+            fh.write(f'{paper_sha1}\t{paper_text}\n')
+            fingerprints[get_document_parse_key(path)] = fingerprint
+            paper_ids.append(paper_sha1)
+
+        fm.flush()
+        manifest_entry = {'files': fingerprints,
+                          'paper_ids': paper_ids,
+                          'corpus_offset': fh.tell(),
+                          'metadata_offset': fm.tell(),
+                          'num_articles': len(paper_ids)}
+        metadata_writer.close()
+
+    os.replace(f'{corpus_output_path}.tmp', corpus_output_path)
+    os.replace(f'{metadata_output_path}.tmp', metadata_output_path)
+    write_fingerprints(join(corpus_output_dir, FINGERPRINTS_FILENAME), fingerprints)
+
+    # The whole output is recorded as one completed batch, so that --resume on it doesn't start over
+    manifest_path = join(corpus_output_dir, MANIFEST_FILENAME)
+    with open(f'{manifest_path}.tmp', 'w') as f_manifest:
+        append_manifest_entry(f_manifest, manifest_entry)
+    os.replace(f'{manifest_path}.tmp', manifest_path)
+
+    print(f'Success: {len(paper_ids)} CORD-19 articles written to {corpus_output_dir}')
@@ -0,0 +1,99 @@
+import threading
+import time
+
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+
+from config import WRITE_BATCH_SIZE, WRITE_FLUSH_INTERVAL
+from corpus_builder.database.database import Post
+
+
+class PostWriter:
+    # Buffers posts and writes them with one unordered bulk operation per batch. A batch is flushed once it holds
+    # `batch_size` posts, or `flush_interval` seconds after the previous flush. Used as a context manager, a background
+    # thread flushes on time even while no posts are being added, e.g. while discovery waits for slow index pages.
+    # A batch that couldn't be written at all stays buffered: the background thread reports the error and retries,
+    # while a flush from `add` or on exit raises it.
+    # With `upsert`, existing posts with the same URL are replaced instead of being reported as duplicates.
+    # `on_saved` is called with the documents of each batch that were actually written.
+    def __init__(self, batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL, upsert=False, on_saved=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.upsert = upsert
+        self.on_saved = on_saved
+        self.buffer = []
+        self.num_saved = 0
+        self.last_flush_time = time.monotonic()
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._flush_thread = None
+
+    def __enter__(self):
+        self._stopped.clear()
+        self._flush_thread = threading.Thread(target=self.flush_periodically, daemon=True)
+        self._flush_thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stopped.set()
+        self._flush_thread.join()
+        self.flush()
+
+    def get_seconds_until_flush(self):
+        return self.last_flush_time + self.flush_interval - time.monotonic()
+
+    def flush_periodically(self):
+        while not self._stopped.wait(max(self.get_seconds_until_flush(), 0)):
+            with self._lock:
+                if self.get_seconds_until_flush() <= 0:
+                    try:
+                        self.flush()
+                    except Exception as e:
+                        # The posts stay buffered, so the flush is retried after the next interval
+                        print(f'Failed to save a batch of articles to MongoDB! Exception: {e}')
+
+    def add(self, post):
+        post.validate()
+        with self._lock:
+            self.buffer.append(post.to_mongo().to_dict())
+
+            if len(self.buffer) >= self.batch_size or self.get_seconds_until_flush() <= 0:
+                self.flush()
+
+    def write_batch(self, collection, documents):
+        if self.upsert:
+            operations = [ReplaceOne({'url': document['url']}, document, upsert=True) for document in documents]
+            result = collection.bulk_write(operations, ordered=False)
+            return result.upserted_count + result.matched_count
+
+        result = collection.insert_many(documents, ordered=False)
+        return len(result.inserted_ids)
+
+    def flush(self):
+        with self._lock:
+            documents = self.buffer
+            self.buffer = []
+            self.last_flush_time = time.monotonic()
+            if not documents:
+                return
+
+            try:
+                num_saved = self.write_batch(Post._get_collection(), documents)
+                saved_documents = documents
+            except BulkWriteError as e:
+                # Unordered writes carry on past failing documents, so only the reported ones were not saved
+                failed_indexes = set()
+                for error in e.details['writeErrors']:
+                    print(f'Skipping article {documents[error["index"]]["url"]}! Exception: {error["errmsg"]}')
+                    failed_indexes.add(error['index'])
+                num_saved = sum(e.details.get(key, 0) for key in ('nInserted', 'nUpserted', 'nMatched'))
+                saved_documents = [document for index, document in enumerate(documents) if index not in failed_indexes]
+            except Exception:
+                # Nothing is known to be saved (e.g. the connection was lost), so the batch is written again later
+                self.buffer = documents + self.buffer
+                raise
+
+            if self.on_saved is not None:
+                self.on_saved(saved_documents)
+            self.num_saved += num_saved
+            print(f'Saved a batch of {num_saved} articles to MongoDB')
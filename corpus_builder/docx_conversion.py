@@ -0,0 +1,19 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pypandoc
+
+
+def convert_text_to_docx(text, output_docx):
+    # The text is piped to pandoc's stdin, so no temporary file is written
+    pypandoc.convert_text(f'{text}\n', 'docx', format='markdown', outputfile=output_docx)
+    return output_docx
+
+
+def convert_texts_to_docx(texts_and_paths, workers=None):
+    # Every conversion is a separate pandoc process, so a thread pool is enough to keep all cores busy
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [executor.submit(convert_text_to_docx, text, output_docx) for text, output_docx in texts_and_paths]
+        for index, future in enumerate(as_completed(futures)):
+            print(f'Converted {future.result()} ({index + 1}/{len(futures)})')
+    return len(futures)
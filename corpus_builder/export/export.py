@@ -1,20 +1,24 @@
-import json
 import os
 import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from os.path import join
 from pathlib import Path
 
-import pypandoc
 from mongoengine import *
 
 from config import JSON_INDENT, DB_PORT, MONGO_DB_NAME
+from corpus_builder import json_codec
 from corpus_builder.database.database import Post
-from corpus_builder.utilities import remove_none_dict_values, decode_unicode, replace_linebreaks
+from corpus_builder.docx_conversion import convert_texts_to_docx
+from corpus_builder.utilities import remove_none_dict_values, decode_unicode, replace_linebreaks, JsonArrayWriter
 
 ID_FORMAT = '{ID:05d}_{SOURCE}'
 ID_FORMAT_TWITTER = '{ID:05d}_{SOURCE}_{USERNAME}'
 JSON_FILENAME = '{ID:05d}_{SOURCE}.json'
 JSON_FILENAME_TWITTER = '{ID:05d}_{SOURCE}_{USERNAME}.json'
+EXPORT_BATCH_SIZE = 1000
+RAW_ARTICLE_PROJECTION = {'_id': False, 'scrape_datetime': False}
 
 
 def pop_article_content(article):
@@ -33,69 +37,127 @@ def prepare_article_dict(article):
     return prepared_article
 
 
-def export_articles(source, output_dir, limit=None, db_name=MONGO_DB_NAME):
-    connect(db_name, host='localhost', port=DB_PORT)
-    articles = Post.objects.filter(source=source.name.lower())
+def prepare_raw_article_dict(document):
+    # Same output as prepare_article_dict for a document read with RAW_ARTICLE_PROJECTION, without building a Post
+    prepared_article = remove_none_dict_values(document)
+    prepared_article['id'] = prepared_article.pop('id_custom')
+    return prepared_article
 
-    articles_json = []
-    articles_content = []
 
+def find_raw_articles(source, limit=None):
+    query = {'source': source.name.lower()}
+    collection = Post._get_collection()
+    cursor = collection.find(query, projection=RAW_ARTICLE_PROJECTION, batch_size=EXPORT_BATCH_SIZE)
     if limit:
-        max_num_articles_export = min(len(articles), limit)
-    else:
-        max_num_articles_export = len(articles)
+        return cursor.limit(limit), collection.count_documents(query, limit=limit)
+    return cursor, collection.count_documents(query)
 
-    for index, article in enumerate(articles[:max_num_articles_export]):
-        print(f'Processing article {index + 1}/{max_num_articles_export}')
-        prepared_article = prepare_article_dict(article)
-        content = pop_article_content(prepared_article)
 
-        articles_json.append(prepared_article)
-        article_id = ID_FORMAT.format(ID=prepared_article['id'], SOURCE=prepared_article['source'])
-        articles_content.append(f'{article_id}\t{content}\n')
+def export_articles(source, output_dir, limit=None, db_name=MONGO_DB_NAME):
+    connect(db_name, host='localhost', port=DB_PORT)
+
+    # The articles are streamed from a batched cursor as plain documents and written one by one, so memory use
+    # doesn't grow with the number of articles and no Post objects need to be built
+    articles, max_num_articles_export = find_raw_articles(source, limit)
 
     if not os.path.isabs(output_dir):
         output_dir = os.path.join(os.getcwd(), output_dir)
 
     corpus_filepath = join(output_dir, source.name.lower(), 'corpus.txt')
+    json_filepath = join(output_dir, source.name.lower(), 'metadata.json')
     Path(corpus_filepath).parent.mkdir(parents=True, exist_ok=True)
-    with open(corpus_filepath, 'w') as f:
-        for article in articles_content:
-            f.write(f'{article}')
 
-    json_filepath = join(output_dir, source.name.lower(), 'metadata.json')
-    Path(json_filepath).parent.mkdir(parents=True, exist_ok=True)
-    with open(json_filepath, 'w') as f:
-        json.dump(articles_json, f, indent=JSON_INDENT, sort_keys=True)
+    with open(corpus_filepath, 'w') as corpus_file, open(json_filepath, 'w') as json_file, \
+            JsonArrayWriter(json_file, indent=JSON_INDENT, sort_keys=True) as json_writer:
+        for index, article in enumerate(articles):
+            print(f'Processing article {index + 1}/{max_num_articles_export}')
+            prepared_article = prepare_raw_article_dict(article)
+            content = pop_article_content(prepared_article)
+
+            json_writer.write(prepared_article)
+            article_id = ID_FORMAT.format(ID=prepared_article['id'], SOURCE=prepared_article['source'])
+            corpus_file.write(f'{article_id}\t{content}\n')
 
     print(f'Success: {max_num_articles_export} articles from {source.name.capitalize()} '
           f'have been saved to {Path(corpus_filepath).parent}')
+    return max_num_articles_export
+
+
+def export_articles_timed(source, output_dir, limit=None, db_name=MONGO_DB_NAME):
+    start_time = time.perf_counter()
+    num_articles = export_articles(source, output_dir, limit, db_name)
+    return num_articles, time.perf_counter() - start_time
 
 
-def export_sample_docx(source, output_dir, limit=200, db_name=MONGO_DB_NAME):
+def export_all_articles(sources, output_dir, limit=None, db_name=MONGO_DB_NAME, workers=None):
+    # All worker threads share the connection pool opened here; each source keeps its own corpus.txt/metadata.json
+    connect(db_name, host='localhost', port=DB_PORT)
+    if not os.path.isabs(output_dir):
+        output_dir = os.path.join(os.getcwd(), output_dir)
+
+    start_time = time.perf_counter()
+    manifest_sources = {}
+    with ThreadPoolExecutor(max_workers=workers or len(sources)) as executor:
+        futures = {executor.submit(export_articles_timed, source, output_dir, limit, db_name): source
+                   for source in sources}
+        for future in as_completed(futures):
+            num_articles, seconds = future.result()
+            manifest_sources[futures[future].name.lower()] = {'num_articles': num_articles,
+                                                              'seconds': round(seconds, 3)}
+
+    manifest = {'sources': manifest_sources,
+                'num_articles': sum(s['num_articles'] for s in manifest_sources.values()),
+                'seconds': round(time.perf_counter() - start_time, 3)}
+
+    manifest_filepath = join(output_dir, 'manifest.json')
+    Path(manifest_filepath).parent.mkdir(parents=True, exist_ok=True)
+    with open(manifest_filepath, 'w') as f:
+        json_codec.dump(manifest, f, indent=JSON_INDENT, sort_keys=True)
+
+    print(f'Success: {manifest["num_articles"]} articles from {len(sources)} sources have been saved to {output_dir} '
+          f'in {manifest["seconds"]} seconds')
+
+
+def sample_raw_articles(source, limit, seed=None):
+    # Without a seed, MongoDB picks the sample itself with $sample. With a seed, a reservoir sample is taken
+    # over a cursor of IDs only, so memory use depends on `limit` rather than on the size of the collection.
+    query = {'source': source.name.lower()}
+    collection = Post._get_collection()
+
+    if seed is None:
+        pipeline = [{'$match': query}, {'$sample': {'size': limit}}, {'$project': RAW_ARTICLE_PROJECTION}]
+        return list(collection.aggregate(pipeline))
+
+    rng = random.Random(seed)
+    sampled_ids = []
+    for index, document in enumerate(collection.find(query, projection={'_id': True}).sort('_id', 1)):
+        if index < limit:
+            sampled_ids.append(document['_id'])
+        else:
+            replace_index = rng.randint(0, index)
+            if replace_index < limit:
+                sampled_ids[replace_index] = document['_id']
+
+    return list(collection.find({'_id': {'$in': sampled_ids}}, projection=RAW_ARTICLE_PROJECTION).sort('_id', 1))
+
+
+def export_sample_docx(source, output_dir, limit=200, db_name=MONGO_DB_NAME, seed=None):
     if not os.path.isabs(output_dir):
         output_dir = os.path.join(os.getcwd(), output_dir)
     docx_output_dir = join(output_dir, f'{source.name.lower()}_docx_sample/')
     Path(docx_output_dir).mkdir(parents=True, exist_ok=True)
 
     connect(db_name, host='localhost', port=DB_PORT)
-    all_articles = Post.objects.filter(source=source.name.lower())
-    if limit > len(all_articles):
-        limit = len(all_articles)
-    articles = random.sample(list(all_articles), limit)
+    articles = sample_raw_articles(source, limit, seed)
 
-    for index, post in enumerate(articles):
+    texts_and_paths = []
+    for index, article in enumerate(articles):
         print(f'Processing post {index}/{len(articles)}')
-        prepared_article = prepare_article_dict(post)
+        prepared_article = prepare_raw_article_dict(article)
         post_id = ID_FORMAT.format(ID=prepared_article['id'], SOURCE=prepared_article['source'])
         content = pop_article_content(prepared_article)
-        content = f'{content}'
+        texts_and_paths.append((content, join(docx_output_dir, f'{post_id}.docx')))
 
-        output_txt = join(docx_output_dir, f'{post_id}.txt')
-        output_docx = join(docx_output_dir, f'{post_id}.docx')
-        with open(output_txt, "w") as text_file:
-            text_file.write(f'{content}\n')
-        pypandoc.convert_file(output_txt, 'docx', format='markdown', outputfile=output_docx)
-        os.remove(output_txt)
+    convert_texts_to_docx(texts_and_paths)
 
-    print(f'Success: {limit} {source.name.lower()} .docx files have been saved to {docx_output_dir}')
+    print(f'Success: {len(articles)} {source.name.lower()} .docx files have been saved to {docx_output_dir}')
@@ -0,0 +1,39 @@
+import json
+
+from config import JSON_INDENT
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    if orjson is None:
+        return json.loads(data)
+
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        # orjson is stricter than json (no NaN, no integers above 64 bits), so anything it rejects gets a second
+        # chance with json, which also raises the usual error for invalid documents
+        return json.loads(data)
+
+
+def load(fp):
+    return loads(fp.read())
+
+
+def load_file(path):
+    with open(path, 'rb') as fp:
+        return loads(fp.read())
+
+
+def dumps(obj, indent=JSON_INDENT, sort_keys=True):
+    # Always json: orjson can only indent by 2 spaces and doesn't escape non-ASCII characters, so its output
+    # wouldn't be identical to json.dump's
+    return json.dumps(obj, indent=indent, sort_keys=sort_keys)
+
+
+def dump(obj, fp, indent=JSON_INDENT, sort_keys=True):
+    fp.write(dumps(obj, indent=indent, sort_keys=sort_keys))
@@ -0,0 +1,75 @@
+import gzip
+import hashlib
+import json
+import os
+from os.path import join, isfile
+from pathlib import Path
+
+from corpus_builder.scraping.session import get_cache_paths
+from corpus_builder.scraping.settings import HTML_ARCHIVE_DIR, HTTP_CACHE_DIR
+
+
+class HtmlArchive:
+    # Raw pages are stored gzip-compressed under <archive_dir>/<source>/<hash prefix>/<URL hash>.html.gz.
+    # Pages that are in the HTTP cache (because they were served with an ETag or Last-Modified header) are hard-linked
+    # from there instead of being compressed and stored a second time. The cache replaces its files rather than
+    # rewriting them, so the archived copy stays intact when the cache is updated or cleared.
+    # index.jsonl lists the archived URLs with the ID of their stored post. Entries are only added once the post has
+    # been saved, so pages whose extraction failed or whose URL was already stored don't get an entry. When a URL is
+    # archived again, its page is overwritten and the last index entry wins.
+    def __init__(self, source, archive_dir=HTML_ARCHIVE_DIR, http_cache_dir=HTTP_CACHE_DIR):
+        self.source_dir = join(archive_dir, source.name.lower())
+        self.index_path = join(self.source_dir, 'index.jsonl')
+        self.http_cache_dir = http_cache_dir
+
+    def get_cached_page_path(self, url):
+        _, content_path = get_cache_paths(url, self.http_cache_dir)
+        return content_path
+
+    def get_page_path(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return join(self.source_dir, key[:2], f'{key}.html.gz')
+
+    def store(self, url, content):
+        # `content` was either just written to the HTTP cache or served from it
+        page_path = self.get_page_path(url)
+        cached_page_path = self.get_cached_page_path(url)
+        Path(page_path).parent.mkdir(parents=True, exist_ok=True)
+        if isfile(f'{page_path}.tmp'):
+            os.remove(f'{page_path}.tmp')
+        try:
+            os.link(cached_page_path, f'{page_path}.tmp')
+        except OSError:
+            # Not cached, or the cache is on another file system
+            with gzip.open(f'{page_path}.tmp', 'wb') as f:
+                f.write(content)
+        os.replace(f'{page_path}.tmp', page_path)
+
+    def add_to_index(self, entries):
+        Path(self.source_dir).mkdir(parents=True, exist_ok=True)
+        with open(self.index_path, 'a') as f:
+            for url, id_custom in entries:
+                f.write(json.dumps({'url': url, 'id': id_custom}) + '\n')
+
+    def read(self, url):
+        with gzip.open(self.get_page_path(url), 'rb') as f:
+            return f.read()
+
+    def get_entries(self):
+        if not isfile(self.index_path):
+            return []
+
+        ids_by_url = {}
+        with open(self.index_path) as f:
+            for line in f:
+                entry = json.loads(line)
+                ids_by_url[entry['url']] = entry['id']
+        return list(ids_by_url.items())
+
+
+def extract_archived_article(extract_article, archive, url):
+    try:
+        return extract_article(url, archive.read(url))
+    except Exception as e:
+        print(f'Failed to extract {url}! Exception: {e}')
+        return None
@@ -0,0 +1,54 @@
+import json
+
+import trafilatura
+from trafilatura.utils import load_html
+
+
+def parse_html(content):
+    # The raw page bytes are decoded with the detected encoding first; lxml on its own falls back to Latin-1
+    # for pages without a <meta charset>
+    tree = load_html(content)
+    if tree is None:
+        raise ValueError('Not a valid HTML page')
+    return tree
+
+
+def get_meta_data(tree):
+    # Same layout as newspaper's Article.meta_data, e.g. <meta property="og:title"> is found in meta_data['og']['title']
+    meta_data = {}
+    for meta in tree.iter('meta'):
+        key = meta.get('property') or meta.get('name')
+        value = meta.get('content') or meta.get('value')
+        if not key or not value:
+            continue
+
+        key_parts = key.strip().split(':')
+        ref = meta_data
+        for part in key_parts[:-1]:
+            if not isinstance(ref.get(part), dict):
+                ref[part] = {} if part not in ref else {part: ref[part]}
+            ref = ref[part]
+        ref[key_parts[-1]] = value.strip()
+
+    return meta_data
+
+
+def find_first(tree, tag, class_name):
+    for element in tree.find_class(class_name):
+        if element.tag == tag:
+            return element
+    return None
+
+
+def find_json_ld(tree):
+    for script in tree.iter('script'):
+        for line in (script.text or '').split('\n'):
+            if line.startswith('{"@context"'):
+                return json.loads(line)
+    return None
+
+
+def extract_with_trafilatura(tree):
+    # trafilatura cleans the tree in place, so anything else has to be read from the tree before this is called
+    article_tf_json = trafilatura.extract(tree, output_format='json', with_metadata=True)
+    return json.loads(article_tf_json)
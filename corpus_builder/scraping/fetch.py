@@ -0,0 +1,83 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_for_futures
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+
+from config import DEFAULT_CONCURRENCY, DEFAULT_PER_HOST_LIMIT
+from corpus_builder.scraping.session import CachedSession
+
+
+class HostLimiter:
+    def __init__(self, per_host_limit=DEFAULT_PER_HOST_LIMIT, wait=None):
+        self.per_host_limit = per_host_limit
+        self.wait = wait
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def get_semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._semaphores[host]
+
+    @contextmanager
+    def slot(self, url):
+        with self.get_semaphore(urlsplit(url).netloc):
+            try:
+                yield
+            finally:
+                # Politeness budget: a slot is held for `wait` seconds after each request, so a single host
+                # never receives more than per_host_limit requests per `wait` seconds
+                if self.wait:
+                    time.sleep(self.wait)
+
+
+class FetchEngine:
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, per_host_limit=DEFAULT_PER_HOST_LIMIT, wait=None):
+        self.concurrency = concurrency
+        self.limiter = HostLimiter(per_host_limit, wait)
+        self.session = CachedSession(pool_size=concurrency)
+
+    def get(self, url):
+        with self.limiter.slot(url):
+            print(f'Visiting {url}')
+            return self.session.get(url)
+
+    def fetch(self, url):
+        try:
+            return self.get(url)
+        except requests.exceptions.RequestException as e:
+            print(f'Failed to fetch {url}! Exception: {e}')
+            return None
+
+    def map(self, function, items):
+        # Yields (item, result) pairs in completion order. Items are consumed lazily and at most
+        # 2 * concurrency calls are in flight, so `items` may be an unbounded generator.
+        items = iter(items)
+        max_in_flight = 2 * self.concurrency
+        pending = {}
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            try:
+                while True:
+                    for item in items:
+                        pending[executor.submit(function, item)] = item
+                        if len(pending) >= max_in_flight:
+                            break
+
+                    if not pending:
+                        break
+
+                    done, _ = wait_for_futures(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future.result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def fetch_all(self, urls):
+        for (index, url), content in self.map(lambda indexed_url: self.fetch(indexed_url[1]), enumerate(urls)):
+            yield index, url, content
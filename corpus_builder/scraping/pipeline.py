@@ -0,0 +1,186 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait as wait_for_futures
+from functools import partial
+from itertools import islice
+
+import mongoengine
+import requests
+from mongoengine import connect
+
+from config import MONGO_DB_NAME, DB_HOST, DB_PORT, DEFAULT_EXTRACT_WORKERS
+from corpus_builder.database.database import Post
+from corpus_builder.database.writer import PostWriter
+from corpus_builder.scraping.archive import HtmlArchive, extract_archived_article
+
+REEXTRACT_CHUNK_SIZE = 16
+# The extractor processes are started while the fetch threads (and the writer's flush timer) are running, and forking
+# a multi-threaded process can leave locks held in the children, so they are spawned instead
+EXTRACT_MP_CONTEXT = multiprocessing.get_context('spawn')
+
+
+def get_known_urls(source):
+    connect(MONGO_DB_NAME, host=DB_HOST, port=DB_PORT)
+    posts = Post.objects(source=source.name.lower())
+    known_urls = set(posts.scalar('url'))
+    last_id = posts.order_by('-id_custom').scalar('id_custom').first() or 0
+    print(f'Found {len(known_urls)} {source.name.lower()} articles in MongoDB (last ID: {last_id})')
+    return known_urls, last_id
+
+
+def discover_article_urls(get_urls_in_page, engine, num_pages=None, limit=None, known_urls=frozenset(),
+                          full_walk=False):
+    # Index pages are fetched in parallel, but their URLs are yielded in page order (newest first), so finished pages
+    # wait in `finished_pages` until all the pages before them have arrived. Once a page turns out to be empty or to
+    # yield no new links, later pages are no longer requested.
+    # URLs in `known_urls` are neither yielded nor counted towards `limit`. A page that only lists known URLs also
+    # ends the discovery, since the pages after it only list older articles, unless `full_walk` is set.
+    seen_urls = set()
+    num_urls_yielded = 0
+    last_page = num_pages
+    finished_pages = {}
+    next_page_num = 1
+
+    def get_urls_or_none(page_num):
+        try:
+            return get_urls_in_page(page_num, engine.get)
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code == requests.codes.not_found:
+                return []
+            print(f'Failed to fetch page {page_num}! Exception: {e}')
+            return None
+        except requests.exceptions.RequestException as e:
+            print(f'Failed to fetch page {page_num}! Exception: {e}')
+            return None
+
+    def page_nums():
+        page_num = 1
+        while last_page is None or page_num <= last_page:
+            yield page_num
+            page_num += 1
+
+    for page_num, page_urls in engine.map(get_urls_or_none, page_nums()):
+        if last_page is not None and page_num > last_page:
+            continue
+        if page_urls == []:
+            print(f'No article URLs on page {page_num}, not requesting any further pages')
+            last_page = page_num - 1
+        finished_pages[page_num] = page_urls
+
+        while next_page_num in finished_pages and (last_page is None or next_page_num <= last_page):
+            page_urls = finished_pages.pop(next_page_num)
+            current_page_num = next_page_num
+            next_page_num += 1
+            if page_urls is None:
+                continue
+
+            new_urls = [url for url in page_urls if url not in seen_urls]
+            unknown_urls = [url for url in new_urls if url not in known_urls]
+            print(f'Page {current_page_num}: {len(unknown_urls)} new article URLs')
+            if not new_urls or (not unknown_urls and not full_walk):
+                print(f'No new article URLs on page {current_page_num}, not requesting any further pages')
+                last_page = current_page_num - 1
+                break
+
+            seen_urls.update(new_urls)
+            for url in unknown_urls:
+                yield url
+                num_urls_yielded += 1
+                if limit and num_urls_yielded >= limit:
+                    print(f'Collection of article URLs completed. {num_urls_yielded} URLs collected.')
+                    return
+
+    print(f'Collection of article URLs completed. {num_urls_yielded} URLs collected.')
+
+
+def scrape_article_urls(source, article_urls, extract_article, engine, limit=None, last_id=0,
+                        extract_workers=DEFAULT_EXTRACT_WORKERS):
+    connect(MONGO_DB_NAME, host=DB_HOST, port=DB_PORT)
+    print(f'Starting to scrape {source.name.lower()} articles')
+
+    # Pages are downloaded by the engine's worker threads and handed to a pool of extractor processes,
+    # so downloads, CPU-bound extraction and saving overlap. This thread only buffers the extracted posts
+    # and writes them to MongoDB in batches.
+    # `article_urls` may be a generator that is still discovering URLs.
+    # IDs continue from `last_id` so that an incremental crawl doesn't reuse the IDs of stored articles.
+    # Raw pages are kept in the HTML archive so that they can be re-extracted without another crawl; a page is added
+    # to the archive index with its post's ID once the post has been saved.
+    def save_extracted(future, index, article_url):
+        try:
+            post_fields = future.result()
+        except Exception as e:
+            print(f'Skipping article {index + 1}! Exception: {e}')
+            return
+        if post_fields is None:
+            print(f'Skipping article {index + 1}!')
+            return
+
+        post = Post(source=source.name.lower(),
+                    url=article_url,
+                    id_custom=last_id + index + 1,
+                    **post_fields)
+        try:
+            writer.add(post)
+        except mongoengine.errors.ValidationError as e:
+            print(f'Skipping article {index + 1}! Exception: {e}')
+
+    def index_saved(documents):
+        archive.add_to_index([(document['url'], document['id_custom']) for document in documents])
+
+    archive = HtmlArchive(source)
+    extract_workers = extract_workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=extract_workers, mp_context=EXTRACT_MP_CONTEXT) as extractor, \
+            PostWriter(on_saved=index_saved) as writer:
+        max_pending = 2 * extract_workers
+        pending = {}
+
+        for num_processed, (index, article_url, content) in enumerate(engine.fetch_all(islice(article_urls, limit)), 1):
+            print(f'Processing article {num_processed}')
+            if content is None:
+                print(f'Skipping article {index + 1}!')
+                continue
+
+            archive.store(article_url, content)
+            pending[extractor.submit(extract_article, article_url, content)] = (index, article_url)
+
+            if len(pending) >= max_pending:
+                done, _ = wait_for_futures(pending, return_when=FIRST_COMPLETED)
+            else:
+                done = [future for future in pending if future.done()]
+            for future in done:
+                save_extracted(future, *pending.pop(future))
+
+        for future in as_completed(list(pending)):
+            save_extracted(future, *pending.pop(future))
+
+    print(f'Collection of articles completed. {writer.num_saved} articles saved to MongoDB.')
+
+
+def reextract_articles(source, extract_article, extract_workers=DEFAULT_EXTRACT_WORKERS):
+    connect(MONGO_DB_NAME, host=DB_HOST, port=DB_PORT)
+    archive = HtmlArchive(source)
+    entries = archive.get_entries()
+    print(f'Re-extracting {len(entries)} archived {source.name.lower()} articles')
+
+    # Pages are read, decompressed and extracted by the worker processes; stored posts with the same URL are replaced
+    urls = [url for url, _ in entries]
+    with ProcessPoolExecutor(max_workers=extract_workers, mp_context=EXTRACT_MP_CONTEXT) as extractor, \
+            PostWriter(upsert=True) as writer:
+        post_fields_list = extractor.map(partial(extract_archived_article, extract_article, archive), urls,
+                                         chunksize=REEXTRACT_CHUNK_SIZE)
+        for num_processed, ((article_url, id_custom), post_fields) in enumerate(zip(entries, post_fields_list), 1):
+            print(f'Processing article {num_processed}/{len(entries)}')
+            if post_fields is None:
+                print(f'Skipping article {id_custom}!')
+                continue
+
+            post = Post(source=source.name.lower(),
+                        url=article_url,
+                        id_custom=id_custom,
+                        **post_fields)
+            try:
+                writer.add(post)
+            except mongoengine.errors.ValidationError as e:
+                print(f'Skipping article {id_custom}! Exception: {e}')
+
+    print(f'Re-extraction completed. {writer.num_saved} articles saved to MongoDB.')
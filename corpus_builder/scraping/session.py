@@ -0,0 +1,95 @@
+import gzip
+import hashlib
+import json
+import os
+from os.path import join, isfile
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import DEFAULT_CONCURRENCY
+from corpus_builder.scraping.headers import BASIC_HEADERS
+from corpus_builder.scraping.settings import HTTP_CACHE_DIR, MAX_RETRIES, RETRY_BACKOFF_FACTOR, RETRY_STATUSES
+
+
+def get_cache_paths(url, cache_dir=HTTP_CACHE_DIR):
+    key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    cache_subdir = join(cache_dir, key[:2])
+    return join(cache_subdir, f'{key}.json'), join(cache_subdir, f'{key}.html.gz')
+
+
+class CachedSession:
+    def __init__(self, pool_size=DEFAULT_CONCURRENCY, cache_dir=HTTP_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+        retry = Retry(total=MAX_RETRIES, backoff_factor=RETRY_BACKOFF_FACTOR, status_forcelist=RETRY_STATUSES)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.headers.update(BASIC_HEADERS)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_cache_paths(self, url):
+        return get_cache_paths(url, self.cache_dir)
+
+    def get_conditional_headers(self, url):
+        validators_path, content_path = self.get_cache_paths(url)
+        if not isfile(validators_path) or not isfile(content_path):
+            return {}
+
+        with open(validators_path) as f:
+            validators = json.load(f)
+
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
+    def read_cached_content(self, url):
+        _, content_path = self.get_cache_paths(url)
+        with gzip.open(content_path, 'rb') as f:
+            return f.read()
+
+    def write_cached_content(self, url, response):
+        validators = {'etag': response.headers.get('ETag'),
+                      'last_modified': response.headers.get('Last-Modified')}
+        validators_path, content_path = self.get_cache_paths(url)
+        if not validators['etag'] and not validators['last_modified']:
+            # Whatever is cached for the URL is outdated now (the HTML archive relies on this too)
+            for path in (validators_path, content_path):
+                if isfile(path):
+                    os.remove(path)
+            return
+
+        Path(content_path).parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to temporary files first so that concurrent readers never see a partially written entry
+        with gzip.open(f'{content_path}.tmp', 'wb') as f:
+            f.write(response.content)
+        os.replace(f'{content_path}.tmp', content_path)
+        with open(f'{validators_path}.tmp', 'w') as f:
+            json.dump(validators, f)
+        os.replace(f'{validators_path}.tmp', validators_path)
+
+    def get(self, url):
+        response = self.session.get(url, headers=self.get_conditional_headers(url))
+
+        if response.status_code == requests.codes.not_modified:
+            print(f'Not modified since the last crawl: {url}')
+            return self.read_cached_content(url)
+
+        response.raise_for_status()
+        self.write_cached_content(url, response)
+        return response.content
+
+
+shared_session = CachedSession()
+
+
+def get_page(url):
+    return shared_session.get(url)
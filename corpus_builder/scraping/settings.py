@@ -0,0 +1,12 @@
+from os.path import join
+from pathlib import Path
+
+PROJECT_ROOT_DIR = Path(__file__).parent.parent.parent
+TEMP_DIR = join(PROJECT_ROOT_DIR, 'temp/')
+
+HTTP_CACHE_DIR = join(TEMP_DIR, 'http-cache/')
+MAX_RETRIES = 3
+RETRY_BACKOFF_FACTOR = 1
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+HTML_ARCHIVE_DIR = join(TEMP_DIR, 'html-archive/')
@@ -1,17 +1,13 @@
-import json
 from urllib.parse import urljoin
 
-import mongoengine
-import requests
-import trafilatura
 from bs4 import BeautifulSoup
-from mongoengine import connect
-from newspaper import Article
 
-from config import MONGO_DB_NAME, DB_HOST, DB_PORT
-from corpus_builder.database.database import Source, Post
-from corpus_builder.scraping.headers import BASIC_HEADERS
-from corpus_builder.utilities import sleep_for
+from config import DEFAULT_CONCURRENCY, DEFAULT_PER_HOST_LIMIT, DEFAULT_EXTRACT_WORKERS
+from corpus_builder.database.database import Source
+from corpus_builder.scraping.extraction import parse_html, get_meta_data, extract_with_trafilatura
+from corpus_builder.scraping.fetch import FetchEngine
+from corpus_builder.scraping.pipeline import discover_article_urls, get_known_urls, scrape_article_urls
+from corpus_builder.scraping.session import get_page
 
 MAIN_CATEGORY_URL = 'https://www.thesun.co.uk/topic/coronavirus/'
 ROOT_URL = 'https://www.thesun.co.uk'
@@ -19,20 +15,17 @@ ROOT_URL = 'https://www.thesun.co.uk'
 
 def get_num_pages():
     print('Getting the number of pages in pagination')
-    response = requests.request('GET', MAIN_CATEGORY_URL, headers=BASIC_HEADERS)
-    soup = BeautifulSoup(response.content, 'html.parser')
+    soup = BeautifulSoup(get_page(MAIN_CATEGORY_URL), 'html.parser')
     pagination_lis = soup.select('li.rectangle-4-copy-10')
     num_pages = int(pagination_lis[-1].text)
     print(f'Found {num_pages} pages')
     return num_pages
 
 
-def get_urls_in_page(page_num):
+def get_urls_in_page(page_num, fetch_page=get_page):
     page_url_template = 'https://www.thesun.co.uk/topic/coronavirus/page/{page_num}'
     page_url = page_url_template.format(page_num=page_num)
-    print(f'Visiting {page_url}')
-    response = requests.request('GET', page_url, headers=BASIC_HEADERS)
-    soup = BeautifulSoup(response.content, 'html.parser')
+    soup = BeautifulSoup(fetch_page(page_url), 'html.parser')
 
     article_urls = []
     for a_tag_article in soup.select('a.teaser-anchor'):
@@ -45,89 +38,42 @@ def get_urls_in_page(page_num):
     return article_urls
 
 
-def get_all_article_urls_pagination(limit=None, wait=None):
+def get_all_article_urls_pagination(engine, limit=None, known_urls=frozenset(), full_walk=False):
     num_pages = get_num_pages()
     print(f'Starting to collect article URLs: {num_pages} pages to process')
+    return discover_article_urls(get_urls_in_page, engine, num_pages, limit, known_urls, full_walk)
 
-    all_urls = []
-    for page_num in range(1, num_pages + 1):
-        print(f'Processing page {page_num}')
-        current_page_urls = get_urls_in_page(page_num)
-        all_urls.extend(current_page_urls)
-        print(f'Total URLs: {len(all_urls)}')
-        if limit and len(all_urls) >= limit:
-            break
-        if wait:
-            sleep_for(wait)
-
-    print(f'Collection of article URLs completed. {len(all_urls)} URLs collected.')
-    return all_urls
-
-
-def scrape_articles(article_urls, limit=None, wait=None):
-    connect(MONGO_DB_NAME, host=DB_HOST, port=DB_PORT)
-    print('Starting to scrape thesun.com articles')
-
-    num_articles_saved = 0
-    max_num_articles_process = min(len(article_urls), limit)
-    for index, article_url in enumerate(article_urls):
-        print(f'Processing article {index + 1}/{max_num_articles_process}')
-        print(f'Visiting {article_url}')
-
-        try:
-            response = requests.request('GET', article_url, headers=BASIC_HEADERS)
-        except requests.exceptions.TooManyRedirects as e:
-            print(e)
-            print(f'Skipping article {index + 1}/{len(article_urls)}')
-            continue
-        soup = BeautifulSoup(response.content, 'html.parser')
-        html = soup.encode_contents()
-
-        article_n3k = Article(article_url)
-        article_n3k.set_html(html)
-        article_n3k.parse()
-
-        article_tf_json = trafilatura.extract(html, output_format='json', with_metadata=True)
-        try:
-            article_tf = json.loads(article_tf_json)
-        except TypeError as e:
-            print(f'Skipping article {index + 1}! Exception: {e}')
-            continue
-
-        content = article_tf['text']
-        tags = article_tf['tags'].split(', ')
-        date = article_tf['date']
-        author = article_tf['author']
-        title = article_tf['title']
-        try:
-            description = article_n3k.meta_data['og']['description']
-        except KeyError:
-            description = None
-
-        post = Post(source=Source.SUN.name.lower(),
-                    url=article_url,
-                    content=content,
-                    id_custom=index + 1,
-                    title=title,
-                    author=author,
-                    date=date,
-                    description=description,
-                    tags=tags)
-
-        try:
-            post.save()
-            num_articles_saved += 1
-        except mongoengine.errors.NotUniqueError as e:
-            print(f'Skipping article {index + 1}! Exception: {e}')
-
-        if limit and index >= limit - 1:
-            break
-        if wait:
-            sleep_for(wait)
-
-    print(f'Collection of articles completed. {num_articles_saved} articles saved to MongoDB.')
-
-
-def scrape_sun(limit=None, wait=None):
-    article_urls = get_all_article_urls_pagination(limit, wait)
-    scrape_articles(article_urls, limit, wait)
+
+def extract_article(article_url, content):
+    tree = parse_html(content)
+    meta_data = get_meta_data(tree)
+
+    try:
+        article_tf = extract_with_trafilatura(tree)
+    except TypeError as e:
+        print(f'Failed to extract {article_url}! Exception: {e}')
+        return None
+
+    try:
+        description = meta_data['og']['description']
+    except KeyError:
+        description = None
+
+    return {'content': article_tf['text'],
+            'title': article_tf['title'],
+            'author': article_tf['author'],
+            'date': article_tf['date'],
+            'description': description,
+            'tags': article_tf['tags'].split(', ')}
+
+
+def scrape_articles(article_urls, engine, limit=None, last_id=0, extract_workers=DEFAULT_EXTRACT_WORKERS):
+    scrape_article_urls(Source.SUN, article_urls, extract_article, engine, limit, last_id, extract_workers)
+
+
+def scrape_sun(limit=None, wait=None, concurrency=DEFAULT_CONCURRENCY, per_host_limit=DEFAULT_PER_HOST_LIMIT,
+               incremental=False, extract_workers=DEFAULT_EXTRACT_WORKERS, full_walk=False):
+    engine = FetchEngine(concurrency, per_host_limit, wait)
+    known_urls, last_id = get_known_urls(Source.SUN) if incremental else (frozenset(), 0)
+    article_urls = get_all_article_urls_pagination(engine, limit, known_urls, full_walk)
+    scrape_articles(article_urls, engine, limit, last_id, extract_workers)
@@ -1,30 +1,24 @@
-import json
 from urllib.parse import urljoin
 
-import mongoengine
-import requests
-import trafilatura
 from bs4 import BeautifulSoup
 from dateutil.parser import parse
-from mongoengine import connect
-from newspaper import Article
 
-from config import MONGO_DB_NAME, DB_HOST, DB_PORT
-from corpus_builder.database.database import Post, Source
-from corpus_builder.scraping.headers import BASIC_HEADERS
-from corpus_builder.utilities import sleep_for
+from config import DEFAULT_CONCURRENCY, DEFAULT_PER_HOST_LIMIT, DEFAULT_EXTRACT_WORKERS
+from corpus_builder.database.database import Source
+from corpus_builder.scraping.extraction import parse_html, get_meta_data, extract_with_trafilatura
+from corpus_builder.scraping.fetch import FetchEngine
+from corpus_builder.scraping.pipeline import discover_article_urls, get_known_urls, scrape_article_urls
+from corpus_builder.scraping.session import get_page
 
 ROOT_URL = 'https://www.telegraph.co.uk/'
 
 NUM_PAGES_TO_CHECK = 1000
 
 
-def get_current_page_urls(page_num):
+def get_current_page_urls(page_num, fetch_page=get_page):
     PAGE_URL = 'https://www.telegraph.co.uk/coronavirus/page-{page_num}/'
     page_url = PAGE_URL.format(page_num=page_num)
-    print(f'Visiting {page_url}')
-    response = requests.request('GET', page_url, headers=BASIC_HEADERS)
-    soup = BeautifulSoup(response.content, 'html.parser')
+    soup = BeautifulSoup(fetch_page(page_url), 'html.parser')
 
     article_urls = set()
     for a_tag_article in soup.select('a.list-headline__link'):
@@ -36,88 +30,41 @@ def get_current_page_urls(page_num):
     return list(article_urls)
 
 
-def get_all_article_urls_pagination(limit=None, wait=None):
+def get_all_article_urls_pagination(engine, limit=None, known_urls=frozenset(), full_walk=False):
     print(f'Starting to collect article URLs')
+    return discover_article_urls(get_current_page_urls, engine, NUM_PAGES_TO_CHECK + 1, limit, known_urls, full_walk)
 
-    all_urls = []
-    for page_num in range(1, NUM_PAGES_TO_CHECK + 2):
-        print(f'Processing page {page_num}')
-        current_page_urls = get_current_page_urls(page_num)
-        all_urls.extend(current_page_urls)
-        print(f'Total URLs: {len(all_urls)}')
-        if limit and len(all_urls) >= limit:
-            break
-        if wait:
-            sleep_for(wait)
-
-    print(f'Collection of article URLs completed. {len(all_urls)} URLs collected.')
-    return all_urls
-
-
-def scrape_articles(article_urls, limit=None, wait=None):
-    connect(MONGO_DB_NAME, host=DB_HOST, port=DB_PORT)
-    print('Starting to scrape telegraph.co.uk articles')
-
-    num_articles_saved = 0
-    max_num_articles_process = min(len(article_urls), limit)
-    for index, article_url in enumerate(article_urls):
-        print(f'Processing article {index + 1}/{max_num_articles_process}')
-        print(f'Visiting {article_url}')
-
-        try:
-            response = requests.request('GET', article_url, headers=BASIC_HEADERS)
-        except requests.exceptions.TooManyRedirects as e:
-            print(e)
-            print(f'Skipping article {index + 1}/{len(article_urls)}')
-            continue
-        soup = BeautifulSoup(response.content, 'html.parser')
-        html = soup.encode_contents()
-
-        article_n3k = Article(article_url)
-        article_n3k.set_html(html)
-        article_n3k.parse()
-
-        article_tf_json = trafilatura.extract(html, output_format='json', with_metadata=True)
-        try:
-            article_tf = json.loads(article_tf_json)
-        except TypeError as e:
-            print(e)
-            print(f'Skipping article {index + 1}/{len(article_urls)}')
-            continue
-
-        title = article_n3k.meta_data['og']['title']
-        try:
-            description = article_n3k.meta_data['og']['description']
-        except KeyError:
-            description = None
-        date = str(parse(article_tf['date']).date())
-        content = article_tf['text']
-        author = article_tf['author']
-        tags = article_tf['tags'].split(',')
-
-        post = Post(source=Source.TELEGRAPH.name.lower(),
-                    url=article_url,
-                    content=content,
-                    id_custom=index + 1,
-                    title=title,
-                    author=author,
-                    date=date,
-                    description=description,
-                    tags=tags)
-        try:
-            post.save()
-            num_articles_saved += 1
-        except mongoengine.errors.NotUniqueError as e:
-            print(f'Skipping article {index}! Exception: {e}')
-
-        if limit and index >= limit - 1:
-            break
-        if wait:
-            sleep_for(wait)
-
-    print(f'Collection of articles completed. {num_articles_saved} articles saved to MongoDB.')
-
-
-def scrape_telegraph(limit=None, wait=None):
-    article_urls = get_all_article_urls_pagination(limit, wait)
-    scrape_articles(article_urls, limit, wait)
+
+def extract_article(article_url, content):
+    tree = parse_html(content)
+    meta_data = get_meta_data(tree)
+
+    try:
+        article_tf = extract_with_trafilatura(tree)
+    except TypeError as e:
+        print(f'Failed to extract {article_url}! Exception: {e}')
+        return None
+
+    try:
+        description = meta_data['og']['description']
+    except KeyError:
+        description = None
+
+    return {'content': article_tf['text'],
+            'title': meta_data['og']['title'],
+            'author': article_tf['author'],
+            'date': str(parse(article_tf['date']).date()),
+            'description': description,
+            'tags': article_tf['tags'].split(',')}
+
+
+def scrape_articles(article_urls, engine, limit=None, last_id=0, extract_workers=DEFAULT_EXTRACT_WORKERS):
+    scrape_article_urls(Source.TELEGRAPH, article_urls, extract_article, engine, limit, last_id, extract_workers)
+
+
+def scrape_telegraph(limit=None, wait=None, concurrency=DEFAULT_CONCURRENCY, per_host_limit=DEFAULT_PER_HOST_LIMIT,
+                     incremental=False, extract_workers=DEFAULT_EXTRACT_WORKERS, full_walk=False):
+    engine = FetchEngine(concurrency, per_host_limit, wait)
+    known_urls, last_id = get_known_urls(Source.TELEGRAPH) if incremental else (frozenset(), 0)
+    article_urls = get_all_article_urls_pagination(engine, limit, known_urls, full_walk)
+    scrape_articles(article_urls, engine, limit, last_id, extract_workers)
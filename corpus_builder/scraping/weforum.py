@@ -1,17 +1,14 @@
-import json
 from urllib.parse import urljoin
 
-import mongoengine
-import requests
 from bs4 import BeautifulSoup
 from dateutil.parser import parse
-from mongoengine import connect
-from newspaper import Article
 
-from config import MONGO_DB_NAME, DB_HOST, DB_PORT
-from corpus_builder.database.database import Source, Post
-from corpus_builder.scraping.headers import BASIC_HEADERS
-from corpus_builder.utilities import sleep_for
+from config import DEFAULT_CONCURRENCY, DEFAULT_PER_HOST_LIMIT, DEFAULT_EXTRACT_WORKERS
+from corpus_builder.database.database import Source
+from corpus_builder.scraping.extraction import parse_html, get_meta_data, find_first, find_json_ld
+from corpus_builder.scraping.fetch import FetchEngine
+from corpus_builder.scraping.pipeline import discover_article_urls, get_known_urls, scrape_article_urls
+from corpus_builder.scraping.session import get_page
 
 MAIN_CATEGORY_URL = 'https://www.weforum.org/agenda/archive/covid-19'
 ROOT_URL = 'https://www.weforum.org'
@@ -19,20 +16,17 @@ ROOT_URL = 'https://www.weforum.org'
 
 def get_num_pages():
     print('Getting the number of pages in pagination')
-    response = requests.request('GET', MAIN_CATEGORY_URL, headers=BASIC_HEADERS)
-    soup = BeautifulSoup(response.content, 'html.parser')
+    soup = BeautifulSoup(get_page(MAIN_CATEGORY_URL), 'html.parser')
     pagination_info_div = soup.select_one('div.pagination__page-info')
     num_pages = int(pagination_info_div.text[2:])
     print(f'Found {num_pages} pages')
     return num_pages
 
 
-def get_urls_in_page(page_num):
+def get_urls_in_page(page_num, fetch_page=get_page):
     page_url_template = 'https://www.weforum.org/agenda/archive/covid-19?page={page_num}'
     page_url = page_url_template.format(page_num=page_num)
-    print(f'Visiting {page_url}')
-    response = requests.request('GET', page_url, headers=BASIC_HEADERS)
-    soup = BeautifulSoup(response.content, 'html.parser')
+    soup = BeautifulSoup(fetch_page(page_url), 'html.parser')
 
     article_urls = []
     for a_tag_article in soup.select('article:not(.tout--transformation-map) > a.tout__link'):
@@ -48,99 +42,58 @@ def get_urls_in_page(page_num):
     return article_urls
 
 
-def get_all_article_urls_pagination(limit=None, wait=None):
+def get_all_article_urls_pagination(engine, limit=None, known_urls=frozenset(), full_walk=False):
     num_pages = get_num_pages()
     print(f'Starting to collect article URLs: {num_pages} pages to process')
-
-    all_urls = []
-    for page_num in range(1, num_pages + 1):
-        print(f'Processing page {page_num}')
-        current_page_urls = get_urls_in_page(page_num)
-        all_urls.extend(current_page_urls)
-        print(f'Total URLs: {len(all_urls)}')
-        if limit and len(all_urls) >= limit:
-            break
-        if wait:
-            sleep_for(wait)
-
-    print(f'Collection of article URLs completed. {len(all_urls)} URLs collected.')
-    return all_urls
-
-
-def scrape_articles(article_urls, limit=None, wait=None):
-    connect(MONGO_DB_NAME, host=DB_HOST, port=DB_PORT)
-    print('Starting to scrape weforum.org articles')
-
-    num_articles_saved = 0
-    max_num_articles_process = min(len(article_urls), limit)
-    for index, article_url in enumerate(article_urls):
-        print(f'Processing article {index + 1}/{max_num_articles_process}')
-        print(f'Visiting {article_url}')
-
-        response = requests.request('GET', article_url, headers=BASIC_HEADERS)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        html = soup.encode_contents()
-
-        # The library doesn't extract text from weforum.org correctly (returns '\n'). This is a workaround.
-        try:
-            article_text = soup.find('div', class_='article-body').text
-        except AttributeError:
-            try:
-                article_text = soup.find('section', class_='article-story__body').text
-            except AttributeError as e:
-                print(f'Skipping article {index + 1}! Exception: {e}')
-                continue
-
-        article_text = '\n'.join([line.strip() for line in article_text.split('\n')
-                                  if line.strip() and 'We use cookies to improve your' not in line])
-
-        article_n3k = Article(article_url)
-        article_n3k.set_html(html)
-        article_n3k.parse()
-        article_n3k.set_text(article_text)
-
-        try:
-            matched_lines = [line for line in str(soup.html).split('\n') if line.startswith('{"@context"')]
-            metadata = json.loads(matched_lines[0])
-        except Exception as e:
-            print(f'Skipping article {index + 1}! Exception: {e}')
-            continue
-
-        content = article_n3k.text
-        date = str(parse(metadata['dateCreated']).date())
-        if metadata['creator']:
-            author = metadata['creator'][0]
-        else:
-            author = None
-        category = metadata['articleSection']
-        keywords = metadata['keywords']
-        description = article_n3k.meta_data['og']['description']
-        title = article_n3k.meta_data['og']['title']
-
-        post = Post(source=Source.WEFORUM.name.lower(),
-                    url=article_url,
-                    content=content,
-                    id_custom=index + 1,
-                    title=title,
-                    author=author,
-                    date=date,
-                    description=description,
-                    category=category,
-                    keywords=keywords)
-        try:
-            post.save()
-            num_articles_saved += 1
-        except mongoengine.errors.NotUniqueError as e:
-            print(f'Skipping article {index + 1}! Exception: {e}')
-
-        if limit and index >= limit - 1:
-            break
-        if wait:
-            sleep_for(wait)
-
-    print(f'Collection of articles completed. {num_articles_saved} articles saved to MongoDB.')
-
-
-def scrape_weforum(limit=None, wait=None):
-    article_urls = get_all_article_urls_pagination(limit, wait)
-    scrape_articles(article_urls, limit, wait)
+    return discover_article_urls(get_urls_in_page, engine, num_pages, limit, known_urls, full_walk)
+
+
+def extract_article(article_url, content):
+    tree = parse_html(content)
+    meta_data = get_meta_data(tree)
+
+    # The library doesn't extract text from weforum.org correctly (returns '\n'). This is a workaround.
+    article_body = find_first(tree, 'div', 'article-body')
+    if article_body is None:
+        article_body = find_first(tree, 'section', 'article-story__body')
+    if article_body is None:
+        print(f'Failed to extract {article_url}! No article body found')
+        return None
+
+    article_text = article_body.text_content()
+    article_text = '\n'.join([line.strip() for line in article_text.split('\n')
+                              if line.strip() and 'We use cookies to improve your' not in line])
+
+    try:
+        metadata = find_json_ld(tree)
+    except ValueError as e:
+        print(f'Failed to extract {article_url}! Exception: {e}')
+        return None
+    if metadata is None:
+        print(f'Failed to extract {article_url}! No JSON-LD metadata found')
+        return None
+
+    if metadata['creator']:
+        author = metadata['creator'][0]
+    else:
+        author = None
+
+    return {'content': article_text,
+            'title': meta_data['og']['title'],
+            'author': author,
+            'date': str(parse(metadata['dateCreated']).date()),
+            'description': meta_data['og']['description'],
+            'category': metadata['articleSection'],
+            'keywords': metadata['keywords']}
+
+
+def scrape_articles(article_urls, engine, limit=None, last_id=0, extract_workers=DEFAULT_EXTRACT_WORKERS):
+    scrape_article_urls(Source.WEFORUM, article_urls, extract_article, engine, limit, last_id, extract_workers)
+
+
+def scrape_weforum(limit=None, wait=None, concurrency=DEFAULT_CONCURRENCY, per_host_limit=DEFAULT_PER_HOST_LIMIT,
+                   incremental=False, extract_workers=DEFAULT_EXTRACT_WORKERS, full_walk=False):
+    engine = FetchEngine(concurrency, per_host_limit, wait)
+    known_urls, last_id = get_known_urls(Source.WEFORUM) if incremental else (frozenset(), 0)
+    article_urls = get_all_article_urls_pagination(engine, limit, known_urls, full_walk)
+    scrape_articles(article_urls, engine, limit, last_id, extract_workers)
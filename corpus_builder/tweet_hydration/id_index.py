@@ -0,0 +1,66 @@
+import os
+from os.path import join, isfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from corpus_builder import json_codec
+from corpus_builder.tweet_hydration.settings import TWEET_ID_INDEX_DIR
+
+SELECTED_COLUMNS = ['id']
+COLUMN_NAMES_DATAPORT = ['id', 'sentiment_score']
+TWEET_ID_INDEX_FORMAT = 'tweet-ids-uint64-v1'
+
+
+def get_tweet_id_index_paths(csv_path, index_dir=TWEET_ID_INDEX_DIR):
+    base_filename = os.path.basename(csv_path)
+    return join(index_dir, f'{base_filename}.npy'), join(index_dir, f'{base_filename}.json')
+
+
+def read_tweet_ids_csv(csv_path):
+    try:
+        # TweetsCOV19
+        df = pd.read_csv(csv_path, usecols=SELECTED_COLUMNS)
+    except ValueError:
+        # Dataport
+        df = pd.read_csv(csv_path, names=COLUMN_NAMES_DATAPORT, usecols=SELECTED_COLUMNS)
+    return df.iloc[:, 0].to_numpy(dtype=np.uint64)
+
+
+def is_tweet_id_index_valid(csv_path, index_path, sidecar_path):
+    if not isfile(index_path) or not isfile(sidecar_path):
+        return False
+
+    sidecar = json_codec.load_file(sidecar_path)
+    stat = os.stat(csv_path)
+    return sidecar.get('format') == TWEET_ID_INDEX_FORMAT and sidecar.get('source_size') == stat.st_size and \
+        sidecar.get('source_mtime') == stat.st_mtime
+
+
+def build_tweet_id_index(csv_path, index_dir=TWEET_ID_INDEX_DIR):
+    index_path, sidecar_path = get_tweet_id_index_paths(csv_path, index_dir)
+    Path(index_path).parent.mkdir(parents=True, exist_ok=True)
+    stat = os.stat(csv_path)
+    tweet_ids = read_tweet_ids_csv(csv_path)
+
+    # The sidecar is written last, so an index without a matching sidecar is never used
+    with open(f'{index_path}.tmp', 'wb') as f:
+        np.save(f, tweet_ids)
+    os.replace(f'{index_path}.tmp', index_path)
+    with open(f'{sidecar_path}.tmp', 'w') as f:
+        json_codec.dump({'format': TWEET_ID_INDEX_FORMAT,
+                         'source_size': stat.st_size,
+                         'source_mtime': stat.st_mtime,
+                         'num_ids': len(tweet_ids)}, f)
+    os.replace(f'{sidecar_path}.tmp', sidecar_path)
+
+
+def load_tweet_ids(csv_path, index_dir=TWEET_ID_INDEX_DIR):
+    # Each CSV of tweet IDs is converted once into a uint64 array, which is then memory-mapped, so slicing
+    # a batch out of it neither parses nor copies the whole file. The index is rebuilt if the CSV changes.
+    index_path, sidecar_path = get_tweet_id_index_paths(csv_path, index_dir)
+    if not is_tweet_id_index_valid(csv_path, index_path, sidecar_path):
+        print(f'Building tweet ID index for {csv_path}')
+        build_tweet_id_index(csv_path, index_dir)
+    return np.load(index_path, mmap_mode='r')
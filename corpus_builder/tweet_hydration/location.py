@@ -0,0 +1,149 @@
+import os
+import re
+import sqlite3
+import string
+import time
+from functools import lru_cache
+from pathlib import Path
+
+import geograpy
+import pycountry
+import us
+
+from corpus_builder.tweet_hydration.settings import LOCATION_CACHE_PATH
+
+LOCATION_CACHE_SIZE = 100000
+LOCATION_CACHE_MAX_ENTRIES = 1000000
+LOCATION_CACHE_EVICTION_INTERVAL = 1000
+
+
+class LocationCache:
+    # Persistent cache of resolved locations, shared by hydration runs and worker processes. Every process opens its
+    # own connection. Entries that haven't been used for the longest time are evicted once there are more than
+    # `max_entries`. A location that couldn't be resolved is stored with a NULL country.
+    def __init__(self, path=LOCATION_CACHE_PATH, max_entries=LOCATION_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._connection = None
+        self._pid = None
+        self._num_inserts = 0
+
+    @property
+    def connection(self):
+        if self._pid != os.getpid():
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=60)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS locations '
+                                     '(key TEXT PRIMARY KEY, country TEXT, last_used REAL NOT NULL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS locations_last_used ON locations (last_used)')
+            self._connection.commit()
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, key):
+        # Returns (found, country)
+        row = self.connection.execute('SELECT country FROM locations WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return False, None
+
+        with self.connection:
+            self.connection.execute('UPDATE locations SET last_used = ? WHERE key = ?', (time.time(), key))
+        return True, row[0]
+
+    def put(self, key, country):
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO locations (key, country, last_used) VALUES (?, ?, ?)',
+                                    (key, country, time.time()))
+
+        self._num_inserts += 1
+        if self._num_inserts % LOCATION_CACHE_EVICTION_INTERVAL == 0:
+            self.evict()
+
+    def evict(self):
+        with self.connection:
+            num_entries = self.connection.execute('SELECT COUNT(*) FROM locations').fetchone()[0]
+            if num_entries > self.max_entries:
+                self.connection.execute('DELETE FROM locations WHERE key IN '
+                                        '(SELECT key FROM locations ORDER BY last_used LIMIT ?)',
+                                        (num_entries - self.max_entries,))
+
+
+class LocationResolver:
+    # Resolves the country of a user location string. The indexes are built once and the results are cached per
+    # location string, in memory and in `persistent_cache`; the lookups give the same results as checking the countries
+    # one by one in pycountry's order.
+    def __init__(self, cache_size=LOCATION_CACHE_SIZE, persistent_cache=None):
+        countries = list(pycountry.countries)
+        self.country_names = [country.name for country in countries]
+
+        # Every country name found in the location counts and the one that comes last in pycountry wins.
+        # The regex finds the longest name starting at each position; any other name starting there is a prefix
+        # of it, so the best index among a name and its prefixes is computed in advance.
+        names_by_length = sorted(self.country_names, key=len, reverse=True)
+        self.country_name_regex = re.compile('(?=(' + '|'.join(re.escape(name) for name in names_by_length) + '))')
+        self.best_index_by_name = {}
+        for name in self.country_names:
+            self.best_index_by_name[name] = max(i for i, other_name in enumerate(self.country_names)
+                                                if name.startswith(other_name))
+
+        # US state abbreviations (very common)
+        self.usa_states_abbreviations = {state.abbr for state in us.states.STATES}
+
+        # Country abbreviations. Countries are checked in pycountry's order, the 2-letter code before the 3-letter one.
+        # The pycountry library uses 'GBR' and doesn't include 'UK', which is used more commonly; 'UK' is checked
+        # right after the 2-letter code of the first country.
+        self.country_codes = {}
+        for index, country in enumerate(countries):
+            self.country_codes[country.alpha_2] = (3 * index, country.name)
+            self.country_codes[country.alpha_3] = (3 * index + 2, country.name)
+        self.country_codes['UK'] = (1, 'United Kingdom')
+
+        self.punctuation_table = str.maketrans('', '', string.punctuation)
+        self.persistent_cache = persistent_cache
+        self.resolve = lru_cache(maxsize=cache_size)(self.resolve_persistent)
+
+    def find_country_name(self, user_location):
+        indexes = [self.best_index_by_name[match.group(1)]
+                   for match in self.country_name_regex.finditer(user_location)]
+        return self.country_names[max(indexes)] if indexes else None
+
+    def find_country_code(self, user_location_words):
+        matches = [self.country_codes[word] for word in user_location_words if word in self.country_codes]
+        return min(matches)[1] if matches else None
+
+    def resolve_uncached(self, user_location):
+        location = self.find_country_name(user_location)
+
+        user_location_words = [w.translate(self.punctuation_table) for w in user_location.split()]
+        if not location and not self.usa_states_abbreviations.isdisjoint(user_location_words):
+            location = 'United States'
+
+        if not location:
+            location = self.find_country_code(user_location_words)
+
+        if not location:
+            places = geograpy.get_place_context(text=user_location)
+            if places.countries:
+                location = places.countries[0]
+
+        return location
+
+    def resolve_persistent(self, user_location):
+        if self.persistent_cache is None:
+            return self.resolve_uncached(user_location)
+
+        key = user_location.strip()
+        found, location = self.persistent_cache.get(key)
+        if not found:
+            location = self.resolve_uncached(key)
+            self.persistent_cache.put(key, location)
+        return location
+
+    def extract_tweet_location(self, tweet):
+        if tweet['place']:
+            return tweet['place']['country']
+        elif tweet['user']['location']:
+            return self.resolve(tweet['user']['location'])
+        return None
@@ -10,3 +10,5 @@ TWEET_IDS_DIR_DATAPORT = join(TEMP_DIR, 'tweet-ids-dataport')
 TWEET_IDS_DIR_TWEETS_COV19 = join(TEMP_DIR, 'tweet-ids-TweetsCOV19')
 HYDRATION_PROGRESS = join(TEMP_DIR, 'tweet-hydration-progress.json')
 SKIPPED_IDS_RETWEETS = join(TWEETS_HYDRATED_DIR, 'tweet-ids-skipped-retweets.txt')
+LOCATION_CACHE_PATH = join(TEMP_DIR, 'tweet-location-cache.sqlite3')
+TWEET_ID_INDEX_DIR = join(TEMP_DIR, 'tweet-id-index/')
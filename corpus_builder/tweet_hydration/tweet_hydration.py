@@ -1,29 +1,44 @@
-import json
+import csv
 import math
+import multiprocessing
 import os
-import string
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from os import listdir
 from os.path import join, isfile
 from pathlib import Path
 from pprint import pprint
 
 import dateutil.parser
-import geograpy
-import pandas as pd
-import pycountry
-import us
 from tqdm import tqdm
 from twarc import Twarc
 
 from config import JSON_INDENT
+from corpus_builder import json_codec
+from corpus_builder.tweet_hydration.id_index import load_tweet_ids
+from corpus_builder.tweet_hydration.location import LocationResolver, LocationCache
 from corpus_builder.tweet_hydration.settings import TWEET_IDS_DIR_DATAPORT, \
     TWEET_IDS_DIR_TWEETS_COV19, TWEETS_HYDRATED_DIR, HYDRATION_PROGRESS, SKIPPED_IDS_RETWEETS
-from corpus_builder.utilities import replace_linebreaks
+from corpus_builder.utilities import replace_linebreaks, JsonArrayWriter
 
-SELECTED_COLUMNS = ['id']
-COLUMN_NAMES_DATAPORT = ['id', 'sentiment_score']
 BATCH_SIZE = 45000
-twarc_instance = Twarc()
+HYDRATION_CHUNK_SIZE = 100
+HYDRATION_QUEUE_SIZE = 20
+
+
+# Created on first use, so that the worker processes (which import this module again) only build what they use:
+# the workers resolve locations, but never call the Twitter API
+@lru_cache(maxsize=None)
+def get_twarc_instance():
+    return Twarc()
+
+
+@lru_cache(maxsize=None)
+def get_location_resolver():
+    return LocationResolver(persistent_cache=LocationCache())
 
 
 def get_tweet_ids_csv_filepaths():
@@ -54,15 +69,15 @@ def get_tweet_lengths_filename(ids_filename, batch_num):
 def get_overall_progress():
     try:
         with open(HYDRATION_PROGRESS, 'rb') as f:
-            progress = json.load(f)
+            progress = json_codec.load(f)
     except IOError:
         print('Progress file not found. Creating a new progress file...')
         progress = {}
         filepaths = get_tweet_ids_csv_filepaths()
 
         for i in tqdm(range(0, len(filepaths)), desc='Computing required batch count for each CSV'):
-            df = pd.read_csv(filepaths[i])
-            total_iterations_needed = int(math.ceil(len(df.index) / BATCH_SIZE))
+            num_tweet_ids = len(load_tweet_ids(filepaths[i]))
+            total_iterations_needed = int(math.ceil(num_tweet_ids / BATCH_SIZE))
             progress[os.path.basename(filepaths[i])] = {'last_batch': -1, 'total_batches': total_iterations_needed}
 
         progress['last_started_batch_index'] = 0
@@ -70,64 +85,42 @@ def get_overall_progress():
         progress['batches_log'] = []
 
         Path(HYDRATION_PROGRESS).parent.mkdir(parents=True, exist_ok=True)
-        with open(HYDRATION_PROGRESS, 'wb') as f:
-            json.dump(progress, f, sort_keys=True, indent=4)
+        with open(HYDRATION_PROGRESS, 'w') as f:
+            json_codec.dump(progress, f, sort_keys=True, indent=4)
 
     pprint(progress)
     return progress
 
 
 def extract_tweet_location(tweet):
-    usa_states_abbreviations = [state.abbr for state in us.states.STATES]
-    location = None
-    if tweet['place']:
-        location = tweet['place']['country']
-    elif tweet['user']['location']:
-        user_location_words = tweet['user']['location'].split()
-        table = str.maketrans('', '', string.punctuation)
-        user_location_words = [w.translate(table) for w in user_location_words]
-
-        # Full country name
-        for country in pycountry.countries:
-            if country.name in tweet['user']['location']:
-                location = country.name
-
-        # US state abbreviations (very common)
-        if not location:
-            for word in user_location_words:
-                if word in usa_states_abbreviations:
-                    location = 'United States'
-
-        # Country abbreviations
-        if not location:
-            for country in pycountry.countries:
-                # 2-letter abbreviations
-                if country.alpha_2 in user_location_words:
-                    location = country.name
-                    break
-                # The pycountry library uses 'GBR' and doesn't include 'UK', which is used more commonly
-                if 'UK' in user_location_words:
-                    location = 'United Kingdom'
-                    break
-                # 3-letter abbreviations
-                if country.alpha_3 in user_location_words:
-                    location = country.name
-                    break
-
-        if not location:
-            places = geograpy.get_place_context(text=tweet['user']['location'])
-            if places.countries:
-                location = places.countries[0]
-
-    return location
+    return get_location_resolver().extract_tweet_location(tweet)
+
+
+def hydrate_tweet_chunks(ids_to_hydrate, hydrated_chunks):
+    # Runs in a separate thread. An exception is passed on to the consumer in place of the remaining chunks.
+    try:
+        for i in range(0, len(ids_to_hydrate), HYDRATION_CHUNK_SIZE):
+            hydrated_chunks.put(list(get_twarc_instance().hydrate(ids_to_hydrate[i:i + HYDRATION_CHUNK_SIZE])))
+    except Exception as e:
+        hydrated_chunks.put(e)
+        return
+    hydrated_chunks.put(None)
 
 
 def hydrate_tweet_slice(ids_to_hydrate):
-    hydrated_tweets = []
-    for i in tqdm(range(0, len(ids_to_hydrate), 100), desc='Hydrating tweets'):
-        hydrated = twarc_instance.hydrate(ids_to_hydrate[i:i + 100])
-        hydrated_tweets.extend(hydrated)
-    return hydrated_tweets
+    # Yields the hydrated tweets in chunks of (at most) 100 while the next chunks are being looked up.
+    # At most HYDRATION_QUEUE_SIZE chunks wait to be consumed.
+    hydrated_chunks = queue.Queue(maxsize=HYDRATION_QUEUE_SIZE)
+    producer = threading.Thread(target=hydrate_tweet_chunks, args=(ids_to_hydrate, hydrated_chunks), daemon=True)
+    producer.start()
+
+    while True:
+        chunk = hydrated_chunks.get()
+        if chunk is None:
+            break
+        if isinstance(chunk, Exception):
+            raise chunk
+        yield chunk
 
 
 def process_tweet(tweet):
@@ -158,106 +151,153 @@ def process_tweet(tweet):
     return content, processed_metadata
 
 
-def hydrate_tweets():
-    batch_start = 0
-    batch_end = 10
-    progress = get_overall_progress()
+def process_hydrated_tweets(hydrated_tweets):
+    filtered_content = []
+    filtered_tweets = []
+    tweet_length_info_list = []
+    skipped_tweet_ids_retweets = []
 
-    filepaths = get_tweet_ids_csv_filepaths()
-    for batch_index in range(batch_start, batch_end):
-        for filepath_index in range(progress['last_processed_file_index'] + 1, len(filepaths)):
-            filepath = filepaths[filepath_index]
-            base_filename = os.path.basename(filepath)
-            total_batches = progress[base_filename]['total_batches']
-
-            print(f'Processing file {base_filename}. Current batch index: {batch_index}, '
-                  f'total batches for file: {total_batches}')
-
-            if batch_index > total_batches - 1:
-                print(f'Skipping {filepath} (already fully processed)')
-                continue
-            if progress[base_filename]['last_batch'] >= batch_index:
-                print(f'Skipping {filepath} (current batch already processed)')
-                continue
-
-            try:
-                # TweetsCOV19
-                df = pd.read_csv(filepath, usecols=SELECTED_COLUMNS)
-            except ValueError:
-                # Dataport
-                df = pd.read_csv(filepath, names=COLUMN_NAMES_DATAPORT, usecols=SELECTED_COLUMNS)
-
-            start_index = BATCH_SIZE * batch_index
-            end_index = (BATCH_SIZE * batch_index) + BATCH_SIZE
-
-            print(f'Start index: {start_index}, end index: {end_index}')
-            ids_to_hydrate = list(df.iloc[start_index:end_index, 0])
-
-            output_txt_path = get_tweets_hydrated_filename(base_filename, batch_index, json=False)
-            output_json_path = get_tweets_hydrated_filename(base_filename, batch_index, json=True)
-            output_lengths_csv_path = get_tweet_lengths_filename(base_filename, batch_index)
-            Path(output_txt_path).parent.mkdir(parents=True, exist_ok=True)
-            Path(output_json_path).parent.mkdir(parents=True, exist_ok=True)
-            Path(output_lengths_csv_path).parent.mkdir(parents=True, exist_ok=True)
-
-            print(f'len(df) {len(df)}')
-            print(f'len(ids_to_hydrate) {len(ids_to_hydrate)}')
-            hydrated_tweets = hydrate_tweet_slice(ids_to_hydrate)
-            print(f'Hydrating tweets completed...')
-            print(f'len(hydrated_tweets) = {len(hydrated_tweets)}')
-
-            filtered_content = []
-            filtered_tweets = []
-            tweet_length_info_list = []
-            skipped_tweet_ids_retweets = []
-
-            for i in tqdm(range(0, len(hydrated_tweets)), desc='Processing hydrated tweets'):
-                tweet = hydrated_tweets[i]
-                try:
-                    # Exception thrown if tweet is a retweet
-                    _ = tweet['retweeted_status']
-                    skipped_tweet_ids_retweets.append(tweet['id_str'])
-                    # Skip if this is a retweet
-                    continue
-                except KeyError:
-                    content = tweet['full_text']
-                    tweet_length = len(content.split())
-                    tweet_length_info = {'tweet_id': tweet['id_str'],
-                                         'tweet_length': tweet_length}
-                    tweet_length_info_list.append(tweet_length_info)
+    for tweet in hydrated_tweets:
+        try:
+            # Exception thrown if tweet is a retweet
+            _ = tweet['retweeted_status']
+            skipped_tweet_ids_retweets.append(tweet['id_str'])
+            # Skip if this is a retweet
+            continue
+        except KeyError:
+            content = tweet['full_text']
+            tweet_length = len(content.split())
+            tweet_length_info = {'tweet_id': tweet['id_str'],
+                                 'tweet_length': tweet_length}
+            tweet_length_info_list.append(tweet_length_info)
+
+            content, processed_metadata = process_tweet(tweet)
+            filtered_tweets.append(processed_metadata)
+            filtered_content.append(content)
 
-                    content, processed_metadata = process_tweet(tweet)
-                    filtered_tweets.append(processed_metadata)
-                    filtered_content.append(content)
+    return filtered_content, filtered_tweets, tweet_length_info_list, skipped_tweet_ids_retweets
 
-            df_tweet_lengths = pd.DataFrame(tweet_length_info_list)
-            df_tweet_lengths.to_csv(output_lengths_csv_path, encoding='utf-8', index=False)
 
-            with open(output_json_path, 'w') as outfile_json:
-                json.dump(filtered_tweets, outfile_json, sort_keys=True, indent=JSON_INDENT)
+def process_hydrated_chunks(executor, hydrated_chunks, max_in_flight):
+    # Yields the processed chunks in input order. With an executor, up to `max_in_flight` chunks are processed
+    # in parallel; finished chunks are yielded as soon as all chunks before them are done.
+    if executor is None:
+        yield from map(process_hydrated_tweets, hydrated_chunks)
+        return
 
-            with open(output_txt_path, 'w') as outfile_txt:
-                for tweet, content in tqdm(zip(filtered_tweets, filtered_content), desc='Writing tweets to disk'):
-                    outfile_txt.write(f'{tweet["id"]}\t{content}\n')
+    in_flight = deque()
+    for chunk in hydrated_chunks:
+        in_flight.append(executor.submit(process_hydrated_tweets, chunk))
+        while len(in_flight) >= max_in_flight or (in_flight and in_flight[0].done()):
+            yield in_flight.popleft().result()
 
-            with open(SKIPPED_IDS_RETWEETS, 'a') as fh:
-                fh.write('\n'.join(skipped_tweet_ids_retweets))
+    while in_flight:
+        yield in_flight.popleft().result()
 
-            progress['last_started_batch_index'] = batch_index
 
-            if filepath_index == len(filepaths) - 1:
-                progress['last_processed_file_index'] = -1
-            else:
-                progress['last_processed_file_index'] = filepath_index
+def hydrate_tweets(workers=None):
+    batch_start = 0
+    batch_end = 10
+    progress = get_overall_progress()
 
-            progress[base_filename]['last_batch'] = batch_index
-            batches_long_entry = {'batch_index': batch_index,
-                                  'base_filename': base_filename,
-                                  'num_tweets_saved': len(filtered_tweets)}
-            progress['batches_log'].append(batches_long_entry)
+    # Hydrated chunks of tweets flow through the worker processes and are written to disk as they arrive,
+    # so only a bounded number of chunks is held in memory at any time
+    workers = workers or os.cpu_count()
+    # The workers are started while the hydration thread is running; forking a multi-threaded process can leave locks
+    # held in the children, so they are spawned instead
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) \
+        if workers > 1 else None
 
-            with open(HYDRATION_PROGRESS, 'wb') as f:
-                json.dump(progress, f, sort_keys=True, indent=4)
+    try:
+        filepaths = get_tweet_ids_csv_filepaths()
+        for batch_index in range(batch_start, batch_end):
+            for filepath_index in range(progress['last_processed_file_index'] + 1, len(filepaths)):
+                filepath = filepaths[filepath_index]
+                base_filename = os.path.basename(filepath)
+                total_batches = progress[base_filename]['total_batches']
+
+                print(f'Processing file {base_filename}. Current batch index: {batch_index}, '
+                      f'total batches for file: {total_batches}')
+
+                if batch_index > total_batches - 1:
+                    print(f'Skipping {filepath} (already fully processed)')
+                    continue
+                if progress[base_filename]['last_batch'] >= batch_index:
+                    print(f'Skipping {filepath} (current batch already processed)')
+                    continue
 
-            print(f'Batch {batch_index} for {base_filename} completed!')
-            print('*' * 80)
+                tweet_ids = load_tweet_ids(filepath)
+
+                start_index = BATCH_SIZE * batch_index
+                end_index = (BATCH_SIZE * batch_index) + BATCH_SIZE
+
+                print(f'Start index: {start_index}, end index: {end_index}')
+                ids_to_hydrate = tweet_ids[start_index:end_index].tolist()
+
+                output_txt_path = get_tweets_hydrated_filename(base_filename, batch_index, json=False)
+                output_json_path = get_tweets_hydrated_filename(base_filename, batch_index, json=True)
+                output_lengths_csv_path = get_tweet_lengths_filename(base_filename, batch_index)
+                Path(output_txt_path).parent.mkdir(parents=True, exist_ok=True)
+                Path(output_json_path).parent.mkdir(parents=True, exist_ok=True)
+                Path(output_lengths_csv_path).parent.mkdir(parents=True, exist_ok=True)
+
+                print(f'len(tweet_ids) {len(tweet_ids)}')
+                print(f'len(ids_to_hydrate) {len(ids_to_hydrate)}')
+                num_chunks = math.ceil(len(ids_to_hydrate) / HYDRATION_CHUNK_SIZE)
+                processed_chunks = process_hydrated_chunks(executor, hydrate_tweet_slice(ids_to_hydrate), 2 * workers)
+
+                num_tweets_saved = 0
+                num_length_rows = 0
+                num_skipped_retweets = 0
+                with open(output_txt_path, 'w') as outfile_txt, open(output_json_path, 'w') as outfile_json, \
+                        open(output_lengths_csv_path, 'w', encoding='utf-8', newline='') as outfile_lengths, \
+                        open(SKIPPED_IDS_RETWEETS, 'a') as fh:
+                    json_writer = JsonArrayWriter(outfile_json, indent=JSON_INDENT, sort_keys=True)
+                    lengths_writer = csv.writer(outfile_lengths, lineterminator='\n')
+
+                    for filtered_content, filtered_tweets, tweet_length_info_list, skipped_tweet_ids_retweets in \
+                            tqdm(processed_chunks, total=num_chunks, desc='Hydrating and processing tweets'):
+                        for tweet, content in zip(filtered_tweets, filtered_content):
+                            outfile_txt.write(f'{tweet["id"]}\t{content}\n')
+                            json_writer.write(tweet)
+                        num_tweets_saved += len(filtered_tweets)
+
+                        if tweet_length_info_list and not num_length_rows:
+                            lengths_writer.writerow(['tweet_id', 'tweet_length'])
+                        lengths_writer.writerows([info['tweet_id'], info['tweet_length']]
+                                                 for info in tweet_length_info_list)
+                        num_length_rows += len(tweet_length_info_list)
+
+                        # Same as joining all the skipped IDs of the batch with newlines
+                        for tweet_id in skipped_tweet_ids_retweets:
+                            fh.write(f'\n{tweet_id}' if num_skipped_retweets else tweet_id)
+                            num_skipped_retweets += 1
+
+                    json_writer.close()
+                    if not num_length_rows:
+                        outfile_lengths.write('\n')
+
+                print(f'Hydrating tweets completed...')
+                print(f'{num_tweets_saved} tweets saved, {num_skipped_retweets} retweets skipped')
+
+                progress['last_started_batch_index'] = batch_index
+
+                if filepath_index == len(filepaths) - 1:
+                    progress['last_processed_file_index'] = -1
+                else:
+                    progress['last_processed_file_index'] = filepath_index
+
+                progress[base_filename]['last_batch'] = batch_index
+                batches_long_entry = {'batch_index': batch_index,
+                                      'base_filename': base_filename,
+                                      'num_tweets_saved': num_tweets_saved}
+                progress['batches_log'].append(batches_long_entry)
+
+                with open(HYDRATION_PROGRESS, 'w') as f:
+                    json_codec.dump(progress, f, sort_keys=True, indent=4)
+
+                print(f'Batch {batch_index} for {base_filename} completed!')
+                print('*' * 80)
+    finally:
+        if executor is not None:
+            executor.shutdown()
@@ -1,9 +1,13 @@
+import json
 import time
 from random import randrange
 
 import unidecode as unidecode
 
-from config import PARAGRAPH_SEPARATOR
+from config import PARAGRAPH_SEPARATOR, JSON_INDENT
+from corpus_builder import json_codec
+
+JSON_ARRAY_READ_SIZE = 1 << 20
 
 
 def replace_linebreaks(content):
@@ -46,3 +50,84 @@ def remove_none_dict_values(dictionary):
         new_dictionary[k] = v
 
     return new_dictionary
+
+
+class JsonArrayWriter:
+    # Writes a JSON array one item at a time. The output is identical to json.dump(items, fp, indent=indent, sort_keys=...)
+    # `num_items` continues an array whose first items are already in fp and which hasn't been closed yet
+    def __init__(self, fp, indent=JSON_INDENT, sort_keys=True, num_items=0):
+        self.fp = fp
+        self.indent = indent
+        self.sort_keys = sort_keys
+        self.num_items = num_items
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, item):
+        newline_indent = '\n' + ' ' * self.indent
+        encoded_item = json_codec.dumps(item, indent=self.indent, sort_keys=self.sort_keys).replace('\n', newline_indent)
+        separator = ',' if self.num_items else '['
+        self.fp.write(f'{separator}{newline_indent}{encoded_item}')
+        self.num_items += 1
+
+    def close(self):
+        self.fp.write('\n]' if self.num_items else '[]')
+
+
+def iter_json_array(fp, read_size=JSON_ARRAY_READ_SIZE):
+    # Reads a JSON array one item at a time, so that only the current part of the file is held in memory.
+    # An item is only accepted once it is followed by a separator, so that e.g. a number cut off by the end of a read
+    # isn't taken for a complete item.
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    at_end = False
+    expected = '['
+    while True:
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+        if position == len(buffer):
+            if at_end:
+                raise ValueError('Unexpected end of the JSON array')
+            chunk = fp.read(read_size)
+            at_end = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+
+        char = buffer[position]
+        if expected == '[':
+            if char != '[':
+                raise ValueError('Expected a JSON array')
+            position += 1
+            expected = 'first item'
+        elif char == ']' and expected != 'item':
+            return
+        elif expected == ',':
+            if char != ',':
+                raise ValueError('Expected "," or "]" in the JSON array')
+            position += 1
+            expected = 'item'
+        else:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                is_complete = at_end or (end < len(buffer) and buffer[end] in ' \t\n\r,]')
+            except json.JSONDecodeError:
+                if at_end:
+                    raise
+                is_complete = False
+
+            if not is_complete:
+                chunk = fp.read(read_size)
+                at_end = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+
+            yield item
+            position = end
+            expected = ','
@@ -0,0 +1,74 @@
+import argparse
+import os
+import pathlib
+import sys
+import time
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent.absolute()))
+import pandas as pd
+
+from corpus_builder import json_codec
+from corpus_builder.cord19_processing.cord19_processing import get_document_parse_paths, process_paper, \
+    get_authors_and_countries, build_sha_index
+from corpus_builder.utilities import replace_linebreaks
+
+
+def find_paper_info_scan(df_metadata, paper_sha1):
+    # The lookup process_cord19 used before the SHA index: a substring scan of the whole 'sha' column per paper
+    rows = df_metadata.loc[df_metadata['sha'].str.contains(paper_sha1, na=False), :].to_dict('records')
+    return rows[0] if rows else None
+
+
+def time_call(function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+
+def parse_papers(paths):
+    paper_ids = []
+    for path in paths:
+        paper_json = json_codec.load_file(path)
+        replace_linebreaks(process_paper(paper_json))
+        get_authors_and_countries(paper_json)
+        paper_ids.append(paper_json['paper_id'])
+    return paper_ids
+
+
+def lookup_scan(df_metadata, paper_ids):
+    return [find_paper_info_scan(df_metadata, paper_id) for paper_id in paper_ids]
+
+
+def lookup_index(df_metadata, paper_ids):
+    sha_index = build_sha_index(df_metadata)
+    return [sha_index.get(paper_id) for paper_id in paper_ids]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='benchmark_cord19.py',
+                                     description='Compare CORD-19 processing time with the per-paper metadata scan '
+                                                 'and with the SHA index')
+    parser.version = '1.0'
+    parser.add_argument('input_dir', action='store',
+                        help=f'Directory where the source CORD-19 dataset is stored (see README.md)')
+    parser.add_argument('-l', '--limit', action='store', type=int,
+                        help='How many articles to process at most (default: all available)')
+    parser.set_defaults(limit=None)
+
+    args = parser.parse_args()
+    input_dir = os.path.abspath(args.input_dir)
+
+    paths = get_document_parse_paths(input_dir)[:args.limit]
+    df_metadata, read_time = time_call(pd.read_csv, os.path.join(input_dir, 'metadata.csv'))
+    paper_ids, parse_time = time_call(parse_papers, paths)
+    print(f'Read metadata.csv in {read_time:.2f}s, parsed {len(paper_ids)} papers in {parse_time:.2f}s')
+
+    scan_results, scan_time = time_call(lookup_scan, df_metadata, paper_ids)
+    index_results, index_time = time_call(lookup_index, df_metadata, paper_ids)
+    mismatches = sum(1 for a, b in zip(scan_results, index_results) if (a is None) != (b is None) or
+                     (a is not None and a['cord_uid'] != b['cord_uid']))
+    print(f'Papers whose metadata row differs between the two lookups: {mismatches}')
+
+    print(f'Metadata lookups: scan {scan_time:.2f}s, index {index_time:.2f}s (including building the index)')
+    print(f'Processing time before: {read_time + parse_time + scan_time:.2f}s')
+    print(f'Processing time after:  {read_time + parse_time + index_time:.2f}s')
@@ -0,0 +1,81 @@
+import argparse
+import pathlib
+import sys
+import time
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent.absolute()))
+from mongoengine import connect
+
+from config import DB_PORT, MONGO_DB_NAME
+from corpus_builder.database.database import Post, Source
+from corpus_builder.export.export import prepare_article_dict, prepare_raw_article_dict, pop_article_content, \
+    find_raw_articles, EXPORT_BATCH_SIZE
+
+VALID_SOURCES = [Source.GOV_UK_NEWS, Source.TELEGRAPH, Source.GUARDIAN, Source.SUN, Source.WEFORUM]
+
+
+def export_rows_mongoengine(source, limit):
+    articles = Post.objects.filter(source=source.name.lower()).no_cache().batch_size(EXPORT_BATCH_SIZE)
+    if limit:
+        articles = articles.limit(limit)
+    for article in articles:
+        prepared_article = prepare_article_dict(article)
+        pop_article_content(prepared_article)
+        yield prepared_article
+
+
+def export_rows_raw(source, limit):
+    articles, _ = find_raw_articles(source, limit)
+    for document in articles:
+        prepared_article = prepare_raw_article_dict(document)
+        pop_article_content(prepared_article)
+        yield prepared_article
+
+
+def benchmark(name, export_rows, source, limit, repeats):
+    best_time = None
+    num_rows = 0
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        num_rows = sum(1 for _ in export_rows(source, limit))
+        elapsed_time = time.perf_counter() - start_time
+        best_time = elapsed_time if best_time is None else min(best_time, elapsed_time)
+
+    rows_per_second = num_rows / best_time if best_time else float('inf')
+    print(f'{name:<12} {num_rows} rows in {best_time:.2f}s ({rows_per_second:,.0f} rows/s)')
+    return rows_per_second
+
+
+if __name__ == '__main__':
+    sources_listing = ', '.join([s.name.lower() for s in VALID_SOURCES])
+
+    parser = argparse.ArgumentParser(prog='benchmark_export.py',
+                                     description='Compare export throughput of mongoengine documents and raw '
+                                                 'pymongo documents')
+    parser.version = '1.0'
+    parser.add_argument('source', action='store',
+                        help=f'Export articles collected from this source. Valid options: {sources_listing}')
+    parser.add_argument('-l', '--limit', action='store', type=int,
+                        help='How many articles to export at most (default: all available)')
+    parser.add_argument('-r', '--repeats', action='store', type=int,
+                        help='How many times to run each export path; the best run is reported (default: 3)')
+    parser.set_defaults(limit=None, repeats=3)
+
+    args = parser.parse_args()
+
+    try:
+        chosen_source = Source[args.source.upper()]
+        assert chosen_source in VALID_SOURCES
+    except (KeyError, AssertionError):
+        parser.error(f'{args.source} is not a valid source.\n\tValid sources: {sources_listing}')
+        sys.exit()
+
+    connect(MONGO_DB_NAME, host='localhost', port=DB_PORT)
+
+    mismatches = sum(1 for a, b in zip(export_rows_mongoengine(chosen_source, args.limit),
+                                       export_rows_raw(chosen_source, args.limit)) if a != b)
+    print(f'Rows that differ between the two paths: {mismatches}')
+
+    mongoengine_speed = benchmark('mongoengine', export_rows_mongoengine, chosen_source, args.limit, args.repeats)
+    raw_speed = benchmark('raw pymongo', export_rows_raw, chosen_source, args.limit, args.repeats)
+    print(f'Speed-up: {raw_speed / mongoengine_speed:.1f}x')
@@ -4,7 +4,7 @@ import sys
 import os
 
 sys.path.append(str(pathlib.Path(__file__).parent.parent.absolute()))
-from corpus_builder.export.export import export_articles, export_sample_docx
+from corpus_builder.export.export import export_articles, export_sample_docx, export_all_articles
 from corpus_builder.database.database import Source
 
 VALID_SOURCES = [Source.GOV_UK_NEWS, Source.TELEGRAPH, Source.GUARDIAN, Source.SUN, Source.WEFORUM]
@@ -15,8 +15,13 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(prog='export_articles.py',
                                      description='Export articles collected by scrape_articles.py')
     parser.version = '1.0'
-    parser.add_argument('source', action='store',
+    parser.add_argument('source', action='store', nargs='?',
                         help=f'Export articles collected from this source. Valid options: {sources_listing}')
+    parser.add_argument('-a', '--all', action='store_true',
+                        help='Export articles from all sources in parallel and write a manifest.json with row counts '
+                             'and timings (default: no)')
+    parser.add_argument('-w', '--workers', action='store', type=int,
+                        help='How many sources to export in parallel with --all (default: all of them)')
 
     parser.add_argument('-l', '--limit', action='store', type=int,
                         help='How many articles to export most (default: all available)')
@@ -24,11 +29,21 @@ if __name__ == '__main__':
                         help='Directory where to save the articles (default: current working directory)')
     parser.add_argument('-d', '--docx', action='store_true',
                         help='Export a sample of articles in .docx format (default: no). Default limit for .docx: 200')
+    parser.add_argument('-s', '--seed', action='store', type=int,
+                        help='Random seed for a reproducible .docx sample (default: a new sample on every run)')
 
-    parser.set_defaults(limit=None, output_dir=os.getcwd(), docx=False)
+    parser.set_defaults(limit=None, output_dir=os.getcwd(), docx=False, all=False, workers=None, seed=None)
 
     args = parser.parse_args()
 
+    if args.all:
+        if args.docx:
+            parser.error('--all cannot be combined with --docx')
+        export_all_articles(VALID_SOURCES, args.output_dir, args.limit, workers=args.workers)
+        sys.exit()
+    if not args.source:
+        parser.error('a source is required unless --all is given')
+
     try:
         chosen_source = Source[args.source.upper()]
         assert chosen_source in VALID_SOURCES
@@ -40,6 +55,6 @@ if __name__ == '__main__':
         export_articles(chosen_source, args.output_dir, args.limit)
     else:
         if args.limit:
-            export_sample_docx(chosen_source, args.output_dir, args.limit)
+            export_sample_docx(chosen_source, args.output_dir, args.limit, seed=args.seed)
         else:
-            export_sample_docx(chosen_source, args.output_dir)
\ No newline at end of file
+            export_sample_docx(chosen_source, args.output_dir, seed=args.seed)
\ No newline at end of file
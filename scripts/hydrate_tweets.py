@@ -10,5 +10,9 @@ if __name__ == '__main__':
                                      description='Download information about tweet IDs provided '
                                                  '(settings found in corpus_builder/tweet_hydration/settings)')
     parser.version = '1.0'
+    parser.add_argument('-w', '--workers', action='store', type=int,
+                        help='How many processes process the hydrated tweets in parallel (default: number of CPUs)')
+    parser.set_defaults(workers=None)
+
     args = parser.parse_args()
-    hydrate_tweets()
+    hydrate_tweets(args.workers)
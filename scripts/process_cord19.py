@@ -4,7 +4,8 @@ import pathlib
 import sys
 
 sys.path.append(str(pathlib.Path(__file__).parent.parent.absolute()))
-from corpus_builder.cord19_processing.cord19_processing import process_cord19, generate_cord19_docx_sample
+from corpus_builder.cord19_processing.cord19_processing import process_cord19, generate_cord19_docx_sample, \
+    update_cord19
 
 if __name__ == '__main__':
 
@@ -21,13 +22,22 @@ if __name__ == '__main__':
                         help='How many articles to export at most (default: all available)')
     parser.add_argument('-d', '--docx', action='store_true',
                         help='Export a sample of articles in .docx format (default: no). Default limit for .docx: 200')
+    parser.add_argument('-w', '--workers', action='store', type=int,
+                        help='How many processes parse the articles in parallel (default: 1)')
+    parser.add_argument('-r', '--resume', action='store_true',
+                        help='Continue an interrupted run from its last completed batch (default: no)')
+    parser.add_argument('-u', '--update', action='store', dest='previous_output_dir',
+                        help='Output directory of a previous run. Only the articles added or changed since then are '
+                             'processed and merged into its output (default: process all articles)')
 
-    parser.set_defaults(limit=None, output_dir=os.getcwd())
+    parser.set_defaults(limit=None, output_dir=os.getcwd(), workers=1)
 
     args = parser.parse_args()
 
-    if not args.docx:
-        process_cord19(args.input_dir, args.output_dir, args.limit)
+    if args.previous_output_dir:
+        update_cord19(args.input_dir, args.output_dir, args.previous_output_dir, args.limit, args.workers)
+    elif not args.docx:
+        process_cord19(args.input_dir, args.output_dir, args.limit, args.workers, args.resume)
     else:
         if args.limit:
             generate_cord19_docx_sample(args.input_dir, args.output_dir, args.limit)
@@ -0,0 +1,41 @@
+import argparse
+import pathlib
+import sys
+
+sys.path.append(str(pathlib.Path(__file__).parent.parent.absolute()))
+from corpus_builder.scraping import gov_uk_news, guardian, sun, telegraph, weforum
+from corpus_builder.scraping.pipeline import reextract_articles
+
+from config import DEFAULT_EXTRACT_WORKERS
+from corpus_builder.database.database import Source
+
+VALID_SOURCES = [Source.GOV_UK_NEWS, Source.TELEGRAPH, Source.GUARDIAN, Source.SUN, Source.WEFORUM]
+
+if __name__ == '__main__':
+    sources_listing = ', '.join([s.name.lower() for s in VALID_SOURCES])
+
+    parser = argparse.ArgumentParser(prog='reextract_articles.py',
+                                     description='Rebuild articles from the pages archived by scrape_articles.py '
+                                                 'without accessing the network')
+    parser.version = '1.0'
+    parser.add_argument('source', action='store',
+                        help=f'A source to re-extract articles from. Valid options: {sources_listing}')
+    parser.add_argument('-e', '--extract_workers', action='store', type=int,
+                        help='How many processes extract article text in parallel (default: number of CPUs)')
+    parser.set_defaults(extract_workers=DEFAULT_EXTRACT_WORKERS)
+
+    args = parser.parse_args()
+
+    try:
+        chosen_source = Source[args.source.upper()]
+        assert chosen_source in VALID_SOURCES
+    except (KeyError, AssertionError):
+        parser.error(f'{args.source} is not a valid source.\n\tValid sources: {sources_listing}')
+        sys.exit()
+
+    extract_functions = {Source.GOV_UK_NEWS: gov_uk_news.extract_article,
+                         Source.TELEGRAPH: telegraph.extract_article,
+                         Source.GUARDIAN: guardian.extract_article,
+                         Source.SUN: sun.extract_article,
+                         Source.WEFORUM: weforum.extract_article}
+    reextract_articles(chosen_source, extract_functions[chosen_source], args.extract_workers)
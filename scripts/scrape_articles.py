@@ -9,7 +9,7 @@ from corpus_builder.scraping.sun import scrape_sun
 from corpus_builder.scraping.telegraph import scrape_telegraph
 from corpus_builder.scraping.weforum import scrape_weforum
 
-from config import DEFAULT_WAIT_TIME
+from config import DEFAULT_WAIT_TIME, DEFAULT_CONCURRENCY, DEFAULT_PER_HOST_LIMIT, DEFAULT_EXTRACT_WORKERS
 from corpus_builder.database.database import Source
 
 VALID_SOURCES = [Source.GOV_UK_NEWS, Source.TELEGRAPH, Source.GUARDIAN, Source.SUN, Source.WEFORUM]
@@ -29,7 +29,21 @@ if __name__ == '__main__':
                         help='How many articles to scrape at most (default: all available)')
     parser.add_argument('-w', '--wait', action='store', type=int,
                         help=f'Wait time between requests (default: {DEFAULT_WAIT_TIME})')
-    parser.set_defaults(limit=None, wait=DEFAULT_WAIT_TIME)
+    parser.add_argument('-c', '--concurrency', action='store', type=int,
+                        help=f'How many articles to download in parallel (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('-p', '--per_host_limit', action='store', type=int,
+                        help=f'How many parallel requests a single host receives at most '
+                             f'(default: {DEFAULT_PER_HOST_LIMIT})')
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help='Only download articles that are not yet stored in MongoDB (default: no)')
+    parser.add_argument('-e', '--extract_workers', action='store', type=int,
+                        help='How many processes extract article text in parallel (default: number of CPUs)')
+    parser.add_argument('-f', '--full_walk', action='store_true',
+                        help='With -i, keep requesting index pages after a page that only lists stored articles '
+                             '(default: no)')
+    parser.set_defaults(limit=None, wait=DEFAULT_WAIT_TIME, concurrency=DEFAULT_CONCURRENCY,
+                        per_host_limit=DEFAULT_PER_HOST_LIMIT, incremental=False,
+                        extract_workers=DEFAULT_EXTRACT_WORKERS, full_walk=False)
 
     args = parser.parse_args()
 
@@ -40,13 +54,10 @@ if __name__ == '__main__':
         parser.error(f'{args.source} is not a valid source.\n\tValid sources: {sources_listing}')
         sys.exit()
 
-    if chosen_source == Source.GOV_UK_NEWS:
-        scrape_gov_uk_news(args.limit, args.wait)
-    elif chosen_source == Source.TELEGRAPH:
-        scrape_telegraph(args.limit, args.wait)
-    elif chosen_source == Source.GUARDIAN:
-        scrape_guardian(args.limit, args.wait)
-    elif chosen_source == Source.SUN:
-        scrape_sun(args.limit, args.wait)
-    elif chosen_source == Source.WEFORUM:
-        scrape_weforum(args.limit, args.wait)
+    scrape_functions = {Source.GOV_UK_NEWS: scrape_gov_uk_news,
+                        Source.TELEGRAPH: scrape_telegraph,
+                        Source.GUARDIAN: scrape_guardian,
+                        Source.SUN: scrape_sun,
+                        Source.WEFORUM: scrape_weforum}
+    scrape_functions[chosen_source](args.limit, args.wait, args.concurrency, args.per_host_limit, args.incremental,
+                                    args.extract_workers, args.full_walk)